@@ -0,0 +1,291 @@
+# Benchmarks and golden-output regression checks for the simulator hot paths.
+# Usage: python benchmarks/bench.py [--check] [--update-golden] [--compare previous.json] [--output results.json]
+import io
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import itertools
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+import engine
+import cli
+
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden.json")
+GOLDEN_TOLERANCE = 1e-6
+REGRESSION_THRESHOLD = 0.20
+
+# --- Scenarios ---
+BUILDS = {
+    "No Items": [],
+    "Burn": ["Sorcerer's Shoes", "Liandry's Torment", "Zhonya's Hourglass"],
+    "Burst": ["Sorcerer's Shoes", "Shadowflame", "Rabadon's Deathcap", "Void Staff"],
+    "Penetration": ["Spellslingers Shoes", "Cryptbloom", "Blighting Jewel", "Void Staff"],
+    "All Effects": ["Liandry's Torment", "Haunting Guise", "Hextech Alternator", "Fated Ashes", "Shadowflame", "Rabadon's Deathcap"],
+}
+LEVELS = {"q": 5, "w": 5, "e": 5, "r": 3}
+ENEMY_MAX_HP, ENEMY_MR, FEARED, W_RATIO = 3000, 100, True, 0.10
+
+def iter_scenarios():
+    for combo in engine.combo_options.values():
+        for build_name, items in BUILDS.items():
+            yield f"{combo} | {build_name}", combo, items
+
+def simulate_scenario(combo, items):
+    item_stats = engine.aggregate_item_stats(items)
+    sim_duration = engine.get_simulation_duration(combo, item_stats)
+    return engine.simulate_damage_over_time(
+        combo, LEVELS["e"], LEVELS["w"], LEVELS["q"], LEVELS["r"], ENEMY_MAX_HP, ENEMY_MAX_HP, ENEMY_MR,
+        item_stats["total_ap"], item_stats["total_flat_mpen"], item_stats["total_percent_mpen"],
+        FEARED, item_stats["has_liandrys"], item_stats["has_shadowflame"],
+        item_stats["has_haunting_guise"], item_stats["has_alternator"],
+        item_stats["has_fated_ashes"], W_RATIO, sim_duration
+    )
+
+def total_scenario(combo, items):
+    item_stats = engine.aggregate_item_stats(items)
+    sim_duration = engine.get_simulation_duration(combo, item_stats)
+    return engine.simulate_damage_total(
+        combo, LEVELS["e"], LEVELS["w"], LEVELS["q"], LEVELS["r"], ENEMY_MAX_HP, ENEMY_MAX_HP, ENEMY_MR,
+        item_stats["total_ap"], item_stats["total_flat_mpen"], item_stats["total_percent_mpen"],
+        FEARED, item_stats["has_liandrys"], item_stats["has_shadowflame"],
+        item_stats["has_haunting_guise"], item_stats["has_alternator"],
+        item_stats["has_fated_ashes"], W_RATIO, sim_duration
+    )
+
+def compute_scenario(combo, items):
+    return engine.compute_results(items, LEVELS["q"], LEVELS["w"], LEVELS["e"], LEVELS["r"], ENEMY_MAX_HP, ENEMY_MR, combo, FEARED, W_RATIO)
+
+def cached_scenario(combo, items):
+    return engine.run_and_get_results(items, LEVELS["q"], LEVELS["w"], LEVELS["e"], LEVELS["r"], ENEMY_MAX_HP, ENEMY_MR, combo, FEARED, W_RATIO)
+
+# --- Golden Outputs ---
+def collect_outputs():
+    outputs = {}
+    for name, combo, items in iter_scenarios():
+        results = compute_scenario(combo, items)
+        outputs[name] = {"total_damage": results["total_damage"], "final_hp": results["final_hp"], "damage_vs_mr": list(results["damage_vs_mr"])}
+    return outputs
+
+def compare_golden(outputs, golden):
+    mismatches = []
+    for name, expected in golden.items():
+        actual = outputs.get(name)
+        if actual is None:
+            mismatches.append({"scenario": name, "field": "missing"})
+            continue
+        for field in ("total_damage", "final_hp"):
+            if abs(actual[field] - expected[field]) > GOLDEN_TOLERANCE * max(1.0, abs(expected[field])):
+                mismatches.append({"scenario": name, "field": field, "expected": expected[field], "actual": actual[field]})
+        if len(actual["damage_vs_mr"]) != len(expected["damage_vs_mr"]) or any(
+                abs(a - e) > GOLDEN_TOLERANCE * max(1.0, abs(e)) for a, e in zip(actual["damage_vs_mr"], expected["damage_vs_mr"])):
+            mismatches.append({"scenario": name, "field": "damage_vs_mr"})
+    return mismatches
+
+# --- Cross-Path Checks ---
+# Paths that must agree with the scalar engine (or with each other) for every scenario. Each check returns mismatch
+# dicts like compare_golden, so --check fails on them the same way.
+CHECK_MAX_HP_VALUES, CHECK_MR_VALUES = (500, ENEMY_MAX_HP, 9000), (0, ENEMY_MR, 200)
+OPTIMIZER_COMBOS = ("R then Q then E then W Layered Combo", "Just E")
+
+def close_enough(actual, expected):
+    return abs(actual - expected) <= GOLDEN_TOLERANCE * max(1.0, abs(expected))
+
+def scalar_results(combo, items, max_hp=ENEMY_MAX_HP, mr=ENEMY_MR, feared=FEARED):
+    return engine.compute_results(items, LEVELS["q"], LEVELS["w"], LEVELS["e"], LEVELS["r"], max_hp, mr, combo, feared, W_RATIO, [], series=None)
+
+def scalar_kills(combo, items, max_hp, mr):
+    return engine.compute_time_to_kill(items, LEVELS["q"], LEVELS["w"], LEVELS["e"], LEVELS["r"], max_hp, mr, combo, FEARED, W_RATIO)["kills"]
+
+def check_grid_matches_scalar():
+    mismatches = []
+    for name, combo, items in iter_scenarios():
+        grid = engine.compute_damage_grid(items, LEVELS["q"], LEVELS["w"], LEVELS["e"], LEVELS["r"], combo, FEARED,
+                                          CHECK_MAX_HP_VALUES, CHECK_MR_VALUES, w_ratio_override=W_RATIO, time_to_kill=True)
+        for (i, max_hp), (j, mr) in itertools.product(enumerate(CHECK_MAX_HP_VALUES), enumerate(CHECK_MR_VALUES)):
+            expected = scalar_results(combo, items, max_hp, mr)
+            if not close_enough(grid["total_damage"][i, j], expected["total_damage"]) or \
+                    (expected["final_hp"] <= 0) == bool(np.isnan(grid["time_to_kill"][i, j])):
+                mismatches.append({"check": "grid", "scenario": name, "max_hp": max_hp, "mr": mr})
+    return mismatches
+
+def check_monte_carlo_without_delays():
+    # Zero cast delays and a fixed fear outcome leave nothing to sample, so every sample is the deterministic run
+    mismatches = []
+    for name, combo, items in iter_scenarios():
+        summary = engine.run_monte_carlo(items, LEVELS["q"], LEVELS["w"], LEVELS["e"], LEVELS["r"], ENEMY_MAX_HP, ENEMY_MR, combo,
+                                         cast_delay=0, fear_uptime=1.0 if FEARED else 0.0, samples=4, w_ratio_override=W_RATIO, seed=0)
+        expected = scalar_results(combo, items)["total_damage"]
+        if not all(close_enough(damage, expected) for damage in summary["damage_percentiles"].values()):
+            mismatches.append({"check": "monte_carlo", "scenario": name, "expected": expected, "actual": summary["mean_damage"]})
+    return mismatches
+
+def check_single_enemy_teamfight():
+    # One enemy takes the scalar damage while it survives; once it dies the fight stops where time-to-kill stops
+    mismatches = []
+    for name, combo, items in iter_scenarios():
+        fight = engine.compute_teamfight_results(items, LEVELS["q"], LEVELS["w"], LEVELS["e"], LEVELS["r"], [ENEMY_MAX_HP], [ENEMY_MR],
+                                                 combo, FEARED, W_RATIO)
+        ttk = engine.compute_time_to_kill(items, LEVELS["q"], LEVELS["w"], LEVELS["e"], LEVELS["r"], ENEMY_MAX_HP, ENEMY_MR, combo, FEARED, W_RATIO)
+        expected = ttk["damage_dealt"] if ttk["kills"] else scalar_results(combo, items)["total_damage"]
+        kill_time = fight["kill_time"][0]
+        if not close_enough(fight["per_target_damage"][0], expected) or \
+                (ttk["kills"] and not close_enough(kill_time, ttk["time_to_kill"])) or (not ttk["kills"] and not np.isnan(kill_time)):
+            mismatches.append({"check": "teamfight", "scenario": name, "expected": expected, "actual": float(fight["per_target_damage"][0])})
+    return mismatches
+
+def check_kill_solvers():
+    # A finite answer must kill, and one tolerance step past it must not
+    mismatches = []
+    for name, combo, items in iter_scenarios():
+        max_hp = engine.find_max_killable_hp(items, LEVELS["q"], LEVELS["w"], LEVELS["e"], LEVELS["r"], ENEMY_MR, combo, FEARED, W_RATIO, tolerance=1.0)
+        if max_hp is not None and max_hp != np.inf and (not scalar_kills(combo, items, max_hp, ENEMY_MR) or scalar_kills(combo, items, max_hp + 1.0, ENEMY_MR)):
+            mismatches.append({"check": "max_killable_hp", "scenario": name, "actual": max_hp})
+        mr = engine.find_kill_mr_breakpoint(items, LEVELS["q"], LEVELS["w"], LEVELS["e"], LEVELS["r"], ENEMY_MAX_HP, combo, FEARED, W_RATIO, tolerance=0.1)
+        if mr is not None and mr != np.inf and (not scalar_kills(combo, items, ENEMY_MAX_HP, mr) or scalar_kills(combo, items, ENEMY_MAX_HP, mr + 0.1)):
+            mismatches.append({"check": "kill_mr_breakpoint", "scenario": name, "actual": mr})
+    return mismatches
+
+def check_optimizer_brute_force():
+    # The pruned search (serial and on the worker pool) must rank the same scores as scoring every build
+    mismatches = []
+    for combo, metric, slots in itertools.product(OPTIMIZER_COMBOS, ("total_damage", "dps"), (2, 3)):
+        expected = sorted((scalar_results(combo, list(build))[metric] for build in itertools.combinations(engine.ITEM_STATS, slots)), reverse=True)[:5]
+        for processes in (1, 2):
+            ranked = engine.find_top_builds(combo, LEVELS["q"], LEVELS["w"], LEVELS["e"], LEVELS["r"], ENEMY_MAX_HP, ENEMY_MR, FEARED,
+                                            slots=slots, top_n=5, metric=metric, w_ratio_override=W_RATIO, processes=processes)
+            actual = [entry["score"] for entry in ranked]
+            if len(actual) != len(expected) or not all(map(close_enough, actual, expected)):
+                mismatches.append({"check": "optimizer", "scenario": f"{combo} | {metric} | {slots} slots", "processes": processes,
+                                   "expected": expected, "actual": actual})
+    return mismatches
+
+def check_store_round_trip():
+    # Every field comes back as written, keys match across int/float spellings, and other data versions miss
+    mismatches = []
+    with tempfile.TemporaryDirectory() as directory:
+        store = engine.ResultStore(os.path.join(directory, "store.sqlite"), create=True)
+        try:
+            entries = []
+            for name, combo, items in iter_scenarios():
+                for series in engine.SERIES_MODES:
+                    args = (items, LEVELS["q"], LEVELS["w"], LEVELS["e"], LEVELS["r"], ENEMY_MAX_HP, ENEMY_MR, combo, FEARED, W_RATIO, None, series)
+                    entries.append((name, args, engine.compute_results(*args)))
+            store.put_many([(engine.result_cache_key(*args), results) for _, args, results in entries], "golden")
+            for name, args, expected in entries:
+                float_args = args[:5] + (float(ENEMY_MAX_HP), float(ENEMY_MR)) + args[7:]
+                actual = store.get(engine.result_cache_key(*float_args), "golden")
+                if actual is None or store.get(engine.result_cache_key(*args), "other") is not None or actual["series"] != expected["series"] or \
+                        any(actual[f] != expected[f] for f in engine.RESULT_SCALAR_FIELDS) or \
+                        any(actual[f].dtype != expected[f].dtype or not np.array_equal(actual[f], expected[f]) for f in engine.RESULT_ARRAY_FIELDS):
+                    mismatches.append({"check": "store", "scenario": f"{name} | {args[-1]}"})
+        finally:
+            store.close()
+    return mismatches
+
+CLI_ERROR_CASES = [
+    ('{"id": "items", "items": ["Not An Item"]}', "Unknown items: Not An Item"),
+    ('{"id": "combo", "combo": "Not A Combo"}', "Unknown combo: Not A Combo"),
+    ('{"id": "levels", "q": 6, "r": 0}', "Invalid ability levels: q=6 (expected 1-5), r=0 (expected 1-3)"),
+    ('{"id": "number", "mr": "lots"}', "could not convert string to float: 'lots'"),
+    ('[1, 2]', "Expected a JSON object, got list"),
+]
+
+def check_cli_error_lines():
+    # Bad records become {"line", "error"} lines in order, and valid records around them still produce results
+    lines = ['{"id": "first"}'] + [line for line, _ in CLI_ERROR_CASES] + ['{"id": "last"}']
+    out = io.StringIO()
+    errors = cli.run_batch(io.StringIO("\n".join(lines) + "\n"), out)
+    outputs = [json.loads(line) for line in out.getvalue().splitlines()]
+    mismatches = [] if errors == len(CLI_ERROR_CASES) and len(outputs) == len(lines) else [{"check": "cli", "errors": errors, "outputs": len(outputs)}]
+    for line_number, ((_, message), output) in enumerate(zip(CLI_ERROR_CASES, outputs[1:]), start=2):
+        if output.get("line") != line_number or output.get("error") != message:
+            mismatches.append({"check": "cli", "expected": {"line": line_number, "error": message}, "actual": output})
+    if not all("total_damage" in output for output in (outputs[0], outputs[-1])): mismatches.append({"check": "cli", "field": "valid records"})
+    return mismatches
+
+CROSS_PATH_CHECKS = (check_grid_matches_scalar, check_monte_carlo_without_delays, check_single_enemy_teamfight, check_kill_solvers,
+                     check_optimizer_brute_force, check_store_round_trip, check_cli_error_lines)
+
+def run_cross_path_checks():
+    return [mismatch for check in CROSS_PATH_CHECKS for mismatch in check()]
+
+# --- Timing ---
+def time_calls(func, calls, min_time):
+    # Repeats the whole scenario set until min_time has passed and reports per-call throughput
+    func(*calls[0])
+    rounds, start = 0, time.perf_counter()
+    while True:
+        for args in calls: func(*args)
+        rounds += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time: break
+    total_calls = rounds * len(calls)
+    tracemalloc.start()
+    for args in calls: func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"calls": total_calls, "seconds": elapsed, "calls_per_sec": total_calls / elapsed,
+            "mean_us": elapsed / total_calls * 1e6, "peak_memory_bytes": peak}
+
+def run_benchmarks(min_time):
+    scenario_calls = [(combo, items) for _, combo, items in iter_scenarios()]
+    build_calls = [(items,) for items in BUILDS.values()]
+    benchmarks = {
+        "simulate_damage_over_time": lambda combo, items: simulate_scenario(combo, items),
+        "simulate_damage_total": total_scenario,
+        "run_and_get_results (uncached)": compute_scenario,
+        "run_and_get_results (cache hit)": cached_scenario,
+        "get_stats_from_items (uncached)": engine.aggregate_item_stats,
+        "get_stats_from_items (cache hit)": engine.get_stats_from_items,
+    }
+    results = {}
+    for name, func in benchmarks.items():
+        calls = build_calls if name.startswith("get_stats_from_items") else scenario_calls
+        results[name] = time_calls(func, calls, min_time)
+    return results
+
+def compare_runs(current, previous):
+    regressions = []
+    for name, stats in current.items():
+        before = previous.get(name)
+        if not before: continue
+        ratio = stats["calls_per_sec"] / before["calls_per_sec"]
+        stats["speedup_vs_previous"] = ratio
+        if ratio < 1 - REGRESSION_THRESHOLD: regressions.append(name)
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the simulator and check golden outputs.")
+    parser.add_argument("--check", action="store_true", help="exit non-zero on golden mismatches or throughput regressions")
+    parser.add_argument("--update-golden", action="store_true", help="rewrite golden.json from the current engine")
+    parser.add_argument("--compare", help="previous results JSON to compare throughput against")
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds to spend on each benchmark (default 0.5)")
+    parser.add_argument("--output", help="write the results JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    outputs = collect_outputs()
+    if args.update_golden:
+        with open(GOLDEN_PATH, "w") as f: json.dump(outputs, f, indent=1, sort_keys=True)
+    with open(GOLDEN_PATH) as f: golden = json.load(f)
+    report = {"python": platform.python_version(), "platform": platform.platform(), "scenarios": len(outputs),
+              "golden_mismatches": compare_golden(outputs, golden), "cross_path_mismatches": run_cross_path_checks(),
+              "benchmarks": run_benchmarks(args.min_time)}
+    if args.compare:
+        with open(args.compare) as f: report["regressions"] = compare_runs(report["benchmarks"], json.load(f)["benchmarks"])
+
+    text = json.dumps(report, indent=1)
+    if args.output:
+        with open(args.output, "w") as f: f.write(text + "\n")
+    else:
+        print(text)
+    failed = report["golden_mismatches"] or report["cross_path_mismatches"] or report.get("regressions")
+    return 1 if args.check and failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
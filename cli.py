@@ -0,0 +1,99 @@
+# Batch CLI: reads scenarios as JSONL or CSV and streams one JSON result per line.
+import sys
+import csv
+import json
+import argparse
+from engine import ITEM_STATS, ABILITY_DATA, combo_options, compute_results
+
+# --- Scenario defaults (match the Streamlit sidebar) ---
+SCENARIO_DEFAULTS = {"items": [], "q": 5, "w": 5, "e": 5, "r": 3, "max_hp": 3000, "mr": 100,
+                     "combo": "R then Q then E then W Layered Combo", "feared": True, "w_ratio_override": None}
+NUMBER_FIELDS = ("max_hp", "mr")
+# Valid levels are the keys of each ability's per-level table
+LEVEL_TABLES = {"q": ("Q_Terrify", "base_health_percents"), "w": ("W_Drain", "base_tick_damages"),
+                "e": ("E_Reap", "base_damages"), "r": ("R_Crowstorm", "base_tick_damages")}
+
+# --- Record Parsing ---
+def parse_bool(value):
+    if isinstance(value, bool): return value
+    return str(value).strip().lower() in ("1", "true", "yes", "y")
+
+def parse_scenario(record):
+    scenario = dict(SCENARIO_DEFAULTS)
+    scenario.update({k: v for k, v in record.items() if k in SCENARIO_DEFAULTS and v not in (None, "")})
+    items = scenario["items"]
+    if isinstance(items, str): items = [name.strip() for name in items.replace("|", ";").split(";") if name.strip()]
+    unknown = [name for name in items if name not in ITEM_STATS]
+    if unknown: raise ValueError(f"Unknown items: {', '.join(unknown)}")
+    scenario["items"] = list(items)
+    combo = scenario["combo"]
+    if combo in combo_options: combo = combo_options[combo]
+    if combo not in combo_options.values(): raise ValueError(f"Unknown combo: {combo}")
+    scenario["combo"] = combo
+    for field in LEVEL_TABLES: scenario[field] = int(scenario[field])
+    invalid = [f"{field}={scenario[field]} (expected {min(levels)}-{max(levels)})" for field, levels in
+               ((field, ABILITY_DATA[ability][table]) for field, (ability, table) in LEVEL_TABLES.items()) if scenario[field] not in levels]
+    if invalid: raise ValueError(f"Invalid ability levels: {', '.join(invalid)}")
+    for field in NUMBER_FIELDS: scenario[field] = float(scenario[field])
+    scenario["feared"] = parse_bool(scenario["feared"])
+    if scenario["w_ratio_override"] is not None: scenario["w_ratio_override"] = float(scenario["w_ratio_override"])
+    return scenario
+
+def iter_records(stream, input_format):
+    # Yields (line_number, record); JSONL records stay raw text so decoding errors are reported per line
+    if input_format == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader: yield reader.line_num, record
+        return
+    for line_number, line in enumerate(stream, start=1):
+        if line.strip(): yield line_number, line
+
+def decode_record(record):
+    if isinstance(record, str): record = json.loads(record)
+    if not isinstance(record, dict): raise ValueError(f"Expected a JSON object, got {type(record).__name__}")
+    return record
+
+# --- Evaluation ---
+def evaluate_record(record, mr_sweep=False):
+    scenario = parse_scenario(decode_record(record))
+    results = compute_results(scenario["items"], scenario["q"], scenario["w"], scenario["e"], scenario["r"],
+                              scenario["max_hp"], scenario["mr"], scenario["combo"], scenario["feared"],
+                              scenario["w_ratio_override"], None if mr_sweep else [], series=None)
+    output = {"total_damage": results["total_damage"], "final_hp": results["final_hp"], "dps": results["dps"],
+              "reported_duration": results["reported_duration"]}
+    if mr_sweep: output.update(mr_values=list(results["mr_values"]), damage_vs_mr=list(results["damage_vs_mr"]))
+    return output
+
+def run_batch(stream, out, input_format="jsonl", mr_sweep=False, fail_fast=False):
+    # Records are handled one at a time, so memory stays flat regardless of input size
+    errors = 0
+    for line_number, record in iter_records(stream, input_format):
+        try:
+            record = decode_record(record)
+            output = evaluate_record(record, mr_sweep)
+        except (ValueError, TypeError, KeyError) as exc:
+            if fail_fast: raise
+            errors += 1
+            output = {"line": line_number, "error": str(exc)}
+        if isinstance(record, dict) and "id" in record: output = {"id": record["id"], **output}
+        out.write(json.dumps(output) + "\n")
+        out.flush()
+    return errors
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream Fiddlesticks damage simulations for JSONL/CSV scenarios.")
+    parser.add_argument("input", nargs="?", default="-", help="scenario file, or - for stdin (default)")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="input format (default: from the file extension, else jsonl)")
+    parser.add_argument("--mr-sweep", action="store_true", help="include the damage_vs_mr curve for MR 0-200")
+    parser.add_argument("--fail-fast", action="store_true", help="stop at the first invalid record instead of reporting it")
+    args = parser.parse_args(argv)
+    input_format = args.format or ("csv" if args.input.lower().endswith(".csv") else "jsonl")
+    if args.input == "-":
+        errors = run_batch(sys.stdin, sys.stdout, input_format, args.mr_sweep, args.fail_fast)
+    else:
+        with open(args.input, newline="" if input_format == "csv" else None) as stream:
+            errors = run_batch(stream, sys.stdout, input_format, args.mr_sweep, args.fail_fast)
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
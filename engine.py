@@ -0,0 +1,1371 @@
+# Headless simulation engine: data tables, damage math, simulators and caches. No UI imports.
+import os
+import sys
+import json
+import math
+import time
+import heapq
+import sqlite3
+import hashlib
+import itertools
+import threading
+import multiprocessing
+import warnings
+from array import array
+from collections import deque, OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from functools import lru_cache
+import numpy as np
+
+# --- 0. Global Simulation Parameters ---
+TIME_STEP = 0.05
+DEBUG_MODE = False  # default for the app's damage breakdown panel; see section 9 for profiling
+
+# --- 1. Data Definitions for Items ---
+# Edit ITEM_STATS/ABILITY_DATA through update_item_stats/update_ability_data, or call mark_data_changed() after
+# changing them directly, so cached results, item totals and compiled timelines are rebuilt (see section 8).
+ITEM_STATS = {
+    "Rabadon's Deathcap": {"ap": 130, "passive_ap_multiplier": 0.30},
+    "Shadowflame": {"ap": 110, "flat_mpen": 15, "amp_threshold_percent": 0.40, "amp_value": 1.20},
+    "Sorcerer's Shoes": {"flat_mpen": 12},
+    "Hextech Rocketbelt": {"ap": 70},
+    "Void Staff": {"ap": 90, "percent_mpen": 0.40},
+    "Banshee's Veil": {"ap": 105},
+    "Zhonya's Hourglass": {"ap": 105},
+    "Liandry's Torment": {"ap": 60, "burn_percent_max_hp": 0.01, "burn_tick_interval": 0.5, "burn_initial_delay": 0.15, "amp_trigger_delay": 0.10, "amp_tier_1_relative_time": 1.00, "amp_tier_2_relative_time": 2.00, "amp_level_1_value": 1.02, "amp_level_2_value": 1.04, "amp_level_3_value": 1.06, "extension_duration_after_combo": 2.65},
+    "Needlessly Large Rod": {"ap": 65},
+    "Spellslingers Shoes": {"flat_mpen": 18, "percent_mpen": 0.07},
+    "Blasting Wand": {"ap": 45},
+    "Cryptbloom": {"ap": 75, "percent_mpen": 0.30},
+    "Blighting Jewel": {"ap": 25, "percent_mpen": 0.13},
+    "Haunting Guise": {"ap": 30, "amp_trigger_delay": 0.10, "amp_tier_1_relative_time": 1.00, "amp_tier_2_relative_time": 2.00, "amp_level_1_value": 1.02, "amp_level_2_value": 1.04, "amp_level_3_value": 1.06},
+    "Amplifying Tome": {"ap": 20},
+    "Hextech Alternator": {"ap": 45, "proc_damage": 65},
+    "Fated Ashes": {"ap": 30, "burn_damage": 2.5, "burn_tick_interval": 0.5, "burn_initial_delay": 0.15, "extension_duration_after_combo": 2.65}
+}
+
+# --- 2. Fiddlesticks Ability Data ---
+ABILITY_DATA = {
+    "E_Reap": {"base_damages": {1: 70, 2: 105, 3: 140, 4: 175, 5: 210}, "ap_ratio": 0.50, "cast_time": 0.4},
+    "W_Drain": {"base_tick_damages": {1: 15, 2: 22.5, 3: 30, 4: 37.5, 5: 45}, "ap_ratio_tick": 0.10, "missing_health_percents": {1: 0.12, 2: 0.145, 3: 0.17, 4: 0.195, 5: 0.22}, "total_damage_ticks": 8, "channel_duration": 2, "cast_time": 0.25},
+    "Q_Terrify": {"base_health_percents": {1: 0.04, 2: 0.045, 3: 0.05, 4: 0.055, 5: 0.06}, "ap_ratio_per_100_ap": 0.03, "feared_multiplier": 2, "cast_time": 0.35},
+    "R_Crowstorm": {"base_tick_damages": {1: 37.5, 2: 62.5, 3: 87.5}, "ap_ratio_tick": 0.125, "total_ticks": 20, "channel_duration": 4.75, "cast_time": 0.0}
+}
+
+ABILITY_KEYS = {"Q": "Q_Terrify", "W": "W_Drain", "E": "E_Reap", "R": "R_Crowstorm"}
+TICK_COUNT_FIELDS = {"W": "total_damage_ticks", "R": "total_ticks"}
+
+# --- 2b. Combo Schedules ---
+# Each step is (ability, anchor, tick count, interval). Its first hit lands at round(anchor + cast_time, 2) and
+# "prev" anchors on the previous step's last hit; a tick count of None means the ability's full tick count.
+# The duration is summed in order from numbers and (ABILITY_DATA key, field) references.
+COMBO_SCHEDULES = {
+    "Just Q": {"steps": [("Q", 0.0, None, 0.25)], "duration": [("Q_Terrify", "cast_time")]},
+    "Just W": {"steps": [("W", 0.0, None, 0.25)], "duration": [("W_Drain", "channel_duration")]},
+    "Just E": {"steps": [("E", 0.0, None, 0.25)], "duration": [("E_Reap", "cast_time")]},
+    "Just R": {"steps": [("R", 0.0, None, 0.25)], "duration": [("R_Crowstorm", "channel_duration")]},
+    "R then W": {"steps": [("R", 0.0, None, 0.25), ("W", 0.0, None, 0.25)], "duration": [("R_Crowstorm", "channel_duration")]},
+    "E then W": {"steps": [("E", 0.0, None, 0.25), ("W", "prev", None, 0.25)], "duration": [("W_Drain", "channel_duration"), ("E_Reap", "cast_time")]},
+    "W then E": {"steps": [("W", 0.0, None, 0.25), ("E", "prev", None, 0.25)], "duration": [("W_Drain", "channel_duration"), ("E_Reap", "cast_time")]},
+    "E then Q then W": {"steps": [("E", 0.0, None, 0.25), ("Q", "prev", None, 0.25), ("W", "prev", None, 0.25)],
+                        "duration": [("E_Reap", "cast_time"), ("Q_Terrify", "cast_time"), ("W_Drain", "channel_duration")]},
+    "Q then E then W": {"steps": [("Q", 0.0, None, 0.25), ("E", "prev", None, 0.25), ("W", "prev", None, 0.25)],
+                        "duration": [("Q_Terrify", "cast_time"), ("E_Reap", "cast_time"), ("W_Drain", "channel_duration")]},
+    "R then Q then E then W (Normal) Combo": {"steps": [("R", 0.0, int(2.75 / 0.25) + 1, 0.25), ("Q", 0.0, None, 0.25), ("E", "prev", None, 0.25), ("W", "prev", None, 0.25)],
+                                              "duration": [2.75]},
+    "R then Q then E then W Layered Combo": {"steps": [("R", 0.0, int(4.00 / 0.25) + 1, 0.25), ("Q", 0.0, None, 0.25), ("E", 1.60, None, 0.25), ("W", "prev", None, 0.25)],
+                                             "duration": [4.00]},
+}
+
+combo_options = {str(i): name for i, name in enumerate(COMBO_SCHEDULES, start=1)}
+
+def register_combo(name, steps, duration):
+    # Adds a custom combo without touching the engine; steps and duration use the COMBO_SCHEDULES format
+    for ability, anchor, ticks, interval in steps:
+        if ability not in ABILITY_KEYS: raise ValueError(f"Unknown ability in combo {name!r}: {ability}")
+    COMBO_SCHEDULES[name] = {"steps": list(steps), "duration": list(duration)}
+    if name not in combo_options.values(): combo_options[str(len(combo_options) + 1)] = name
+    mark_data_changed()
+
+# --- 3. Magic Damage Calculation Helper Functions ---
+def calculate_magic_damage_reduction(effective_mr):
+    if effective_mr >= 0: return effective_mr / (100 + effective_mr)
+    else: return 1 - (100 / (100 - effective_mr))
+
+def calculate_effective_mr(enemy_mr, flat_mpen, percent_mpen):
+    effective_mr_after_percent_pen = enemy_mr * (1 - percent_mpen)
+    return max(0, effective_mr_after_percent_pen - flat_mpen)
+
+def calculate_damage_multipliers(enemy_mr_values, flat_mpen, percent_mpen):
+    # Vectorized (1 - reduction) over an array of MR values; penetration never takes effective MR below 0
+    effective_mr = np.maximum(0, np.asarray(enemy_mr_values, dtype=float) * (1 - percent_mpen) - flat_mpen)
+    return 1 - effective_mr / (100 + effective_mr)
+
+# --- 4. Function to Aggregate Stats from Items ---
+def aggregate_item_stats(item_list):
+    total_ap, total_flat_mpen = 18, 0
+    flags = {name: False for name in ["rabadons", "liandrys", "shadowflame", "void_staff", "spellslingers_shoes", "cryptbloom", "blighting_jewel", "haunting_guise", "alternator", "fated_ashes"]}
+    for item_name in item_list:
+        if item_name in ITEM_STATS:
+            stats = ITEM_STATS[item_name]
+            total_ap += stats.get("ap", 0)
+            total_flat_mpen += stats.get("flat_mpen", 0)
+            if item_name == "Rabadon's Deathcap": flags["rabadons"] = True
+            if item_name == "Liandry's Torment": flags["liandrys"] = True
+            if item_name == "Shadowflame": flags["shadowflame"] = True
+            if item_name == "Void Staff": flags["void_staff"] = True
+            if item_name == "Spellslingers Shoes": flags["spellslingers_shoes"] = True
+            if item_name == "Cryptbloom": flags["cryptbloom"] = True
+            if item_name == "Blighting Jewel": flags["blighting_jewel"] = True
+            if item_name == "Haunting Guise": flags["haunting_guise"] = True
+            if item_name == "Hextech Alternator": flags["alternator"] = True
+            if item_name == "Fated Ashes": flags["fated_ashes"] = True
+    mpen_multiplier = 1.0
+    if flags["void_staff"]: mpen_multiplier *= (1 - ITEM_STATS["Void Staff"]["percent_mpen"])
+    if flags["spellslingers_shoes"]: mpen_multiplier *= (1 - ITEM_STATS["Spellslingers Shoes"]["percent_mpen"])
+    if flags["cryptbloom"]: mpen_multiplier *= (1 - ITEM_STATS["Cryptbloom"]["percent_mpen"])
+    if flags["blighting_jewel"]: mpen_multiplier *= (1 - ITEM_STATS["Blighting Jewel"]["percent_mpen"])
+    total_percent_mpen = 1 - mpen_multiplier
+    if flags["rabadons"]: total_ap *= (1 + ITEM_STATS["Rabadon's Deathcap"]["passive_ap_multiplier"])
+    return {
+        "total_ap": total_ap, "total_flat_mpen": total_flat_mpen, "total_percent_mpen": total_percent_mpen,
+        "has_liandrys": flags["liandrys"], "has_shadowflame": flags["shadowflame"], 
+        "has_haunting_guise": flags["haunting_guise"], "has_alternator": flags["alternator"],
+        "has_fated_ashes": flags["fated_ashes"]
+    }
+
+def get_stats_from_items(item_list):
+    # Many scenarios share one build, so aggregation is cached on the order-independent item tuple
+    key = tuple(sorted(item_list))
+    item_stats = ITEM_STATS_CACHE.get(key)
+    if item_stats is None:
+        item_stats = aggregate_item_stats(key)
+        ITEM_STATS_CACHE.put(key, item_stats)
+    return dict(item_stats)
+
+# --- 5. Fiddlesticks Ability & Item Damage Formulas ---
+# Damage before magic resist; prepare_scenario applies mitigation once per scenario and the event handlers in 5b add
+# the HP-dependent terms. A level missing from ABILITY_DATA deals no damage (None for the percent-based terms).
+def calculate_fiddlesticks_e_raw_damage(e_ability_level, total_ap):
+    e_data = ABILITY_DATA["E_Reap"]
+    if e_ability_level not in e_data["base_damages"]: return 0
+    return e_data["base_damages"][e_ability_level] + (total_ap * e_data["ap_ratio"])
+
+def calculate_fiddlesticks_w_raw_tick_damage(w_ability_level, total_ap, ap_ratio_tick):
+    w_data = ABILITY_DATA["W_Drain"]
+    if w_ability_level not in w_data["base_tick_damages"]: return 0
+    return w_data["base_tick_damages"][w_ability_level] + (total_ap * ap_ratio_tick)
+
+def calculate_fiddlesticks_w_missing_health_percent(w_ability_level):
+    # Share of missing HP the final W tick adds
+    return ABILITY_DATA["W_Drain"]["missing_health_percents"].get(w_ability_level)
+
+def calculate_fiddlesticks_q_health_percent(q_ability_level, total_ap):
+    # Share of current HP Q deals, before the fear multiplier
+    q_data = ABILITY_DATA["Q_Terrify"]
+    if q_ability_level not in q_data["base_health_percents"]: return None
+    return q_data["base_health_percents"][q_ability_level] + (total_ap / 100) * q_data["ap_ratio_per_100_ap"]
+
+def calculate_fiddlesticks_r_raw_tick_damage(r_ability_level, total_ap):
+    r_data = ABILITY_DATA["R_Crowstorm"]
+    if r_ability_level not in r_data["base_tick_damages"]: return 0
+    return r_data["base_tick_damages"][r_ability_level] + (total_ap * r_data["ap_ratio_tick"])
+
+def calculate_liandrys_raw_burn_damage(max_hp):
+    return ITEM_STATS["Liandry's Torment"]["burn_percent_max_hp"] * max_hp
+
+def calculate_alternator_raw_proc_damage():
+    return ITEM_STATS["Hextech Alternator"]["proc_damage"]
+
+def calculate_fated_ashes_raw_burn_damage():
+    return ITEM_STATS["Fated Ashes"]["burn_damage"]
+
+# --- 5b. Scenario Preparation ---
+PreparedScenario = namedtuple("PreparedScenario", [
+    "damage_multiplier", "enemy_max_hp", "e_damage", "r_damage", "w_raw_tick", "w_damage", "w_missing_health_percent",
+    "q_health_percent", "q_feared_multiplier", "liandrys_burn_damage", "alternator_proc_damage", "fated_ashes_burn_damage",
+    "shadowflame_threshold_hp", "shadowflame_amp_value"])
+
+def prepare_scenario(e_level, w_level, q_level, r_level, enemy_max_hp, damage_multiplier, total_ap,
+                     is_q_feared=False, w_ap_ratio_override=None):
+    # Resolves everything that is constant for one scenario (mitigation, per-ability damage at this AP and level,
+    # burn/proc values) so the event loop only applies the HP-dependent terms. damage_multiplier is
+    # (1 - reduction); passing an array of them prepares a whole MR sweep at once.
+    w_ratio_to_use = w_ap_ratio_override if w_ap_ratio_override is not None else ABILITY_DATA["W_Drain"]['ap_ratio_tick']
+    w_raw_tick = calculate_fiddlesticks_w_raw_tick_damage(w_level, total_ap, w_ratio_to_use)
+    return PreparedScenario(
+        damage_multiplier, enemy_max_hp,
+        calculate_fiddlesticks_e_raw_damage(e_level, total_ap) * damage_multiplier,
+        calculate_fiddlesticks_r_raw_tick_damage(r_level, total_ap) * damage_multiplier,
+        w_raw_tick, w_raw_tick * damage_multiplier, calculate_fiddlesticks_w_missing_health_percent(w_level),
+        calculate_fiddlesticks_q_health_percent(q_level, total_ap),
+        ABILITY_DATA["Q_Terrify"]["feared_multiplier"] if is_q_feared else None,
+        calculate_liandrys_raw_burn_damage(enemy_max_hp) * damage_multiplier,
+        calculate_alternator_raw_proc_damage() * damage_multiplier,
+        calculate_fated_ashes_raw_burn_damage() * damage_multiplier,
+        ITEM_STATS["Shadowflame"]["amp_threshold_percent"] * enemy_max_hp, ITEM_STATS["Shadowflame"]["amp_value"])
+
+def calculate_prepared_q_damage(prepared, current_hp, is_final):
+    if prepared.q_health_percent is None: return 0
+    raw_damage = current_hp * prepared.q_health_percent
+    if prepared.q_feared_multiplier is not None: raw_damage = raw_damage * prepared.q_feared_multiplier
+    return raw_damage * prepared.damage_multiplier
+
+def calculate_prepared_w_damage(prepared, current_hp, is_final):
+    if not is_final or prepared.w_missing_health_percent is None: return prepared.w_damage
+    hp_after_tick = current_hp - prepared.w_damage
+    return (prepared.w_raw_tick + max(0, prepared.enemy_max_hp - hp_after_tick) * prepared.w_missing_health_percent) * prepared.damage_multiplier
+
+# Event type -> damage before amps, as f(prepared, current_hp, is_final). AMP_CHANGE is handled by the loop itself.
+EVENT_HANDLERS = {
+    'E': lambda prepared, current_hp, is_final: prepared.e_damage,
+    'Q': calculate_prepared_q_damage,
+    'W': calculate_prepared_w_damage,
+    'R': lambda prepared, current_hp, is_final: prepared.r_damage,
+    'LIANDRYS_BURN': lambda prepared, current_hp, is_final: prepared.liandrys_burn_damage,
+    'ALTERNATOR_PROC': lambda prepared, current_hp, is_final: prepared.alternator_proc_damage,
+    'FATED_ASHES_BURN': lambda prepared, current_hp, is_final: prepared.fated_ashes_burn_damage,
+}
+
+def calculate_lane_w_damage(prepared, current_hp, is_final):
+    # calculate_prepared_w_damage for HP arrays
+    if not is_final or prepared.w_missing_health_percent is None: return prepared.w_damage
+    hp_after_tick = current_hp - prepared.w_damage
+    return (prepared.w_raw_tick + np.maximum(0, prepared.enemy_max_hp - hp_after_tick) * prepared.w_missing_health_percent) * prepared.damage_multiplier
+
+# The same handlers for the vectorized engines, where current_hp and the prepared values may be arrays
+LANE_EVENT_HANDLERS = dict(EVENT_HANDLERS, W=calculate_lane_w_damage)
+
+def is_at_or_past_precise_time(current_time, target_time):
+    return current_time >= target_time or math.isclose(current_time, target_time, abs_tol=TIME_STEP / 2)
+
+@lru_cache(maxsize=4096)
+def event_step_index(event_time):
+    # First TIME_STEP tick at which the stepped clock would have picked this event up
+    step = max(0, int((event_time - TIME_STEP) / TIME_STEP))
+    while not is_at_or_past_precise_time(round(step * TIME_STEP, 2), event_time): step += 1
+    return step
+
+# --- 6. Main Simulation Function ---
+CompiledTimeline = namedtuple("CompiledTimeline", ["events", "num_steps", "base_duration", "amp_weights"])
+
+@lru_cache(maxsize=64)
+def compile_combo_schedule(combo_type):
+    # (time, ability, is_final) for the combo's own hits, in schedule order; is_final marks each cast's last tick.
+    # Unknown combos deal no damage.
+    schedule, hits, last_hit_time = COMBO_SCHEDULES.get(combo_type), [], 0.0
+    if schedule is None: return (), 0.0
+    for ability, anchor, ticks, interval in schedule["steps"]:
+        if ticks is None: ticks = ABILITY_DATA[ABILITY_KEYS[ability]][TICK_COUNT_FIELDS[ability]] if ability in TICK_COUNT_FIELDS else 1
+        first_hit = round((last_hit_time if anchor == "prev" else anchor) + ABILITY_DATA[ABILITY_KEYS[ability]]["cast_time"], 2)
+        for i in range(ticks):
+            last_hit_time = round(first_hit + (i*interval), 2)
+            hits.append((last_hit_time, ability, i == ticks - 1))
+    base_duration = 0.0
+    for term in schedule["duration"]: base_duration += ABILITY_DATA[term[0]][term[1]] if isinstance(term, tuple) else term
+    return tuple(hits), base_duration
+
+def compile_timeline(combo_type, has_liandrys_flag=False, has_haunting_guise_flag=False,
+                     has_alternator_flag=False, has_fated_ashes_flag=False,
+                     total_simulation_duration_for_this_build=0.0):
+    # Cached build_timeline; profiled runs also time the lookup and count cache hits, since build/sort time
+    # is only spent on a cold compile
+    args = (combo_type, has_liandrys_flag, has_haunting_guise_flag, has_alternator_flag, has_fated_ashes_flag,
+            total_simulation_duration_for_this_build)
+    profile = get_active_profile()
+    if profile is None: return build_timeline(*args)
+    hits, started = build_timeline.cache_info().hits, time.perf_counter()
+    timeline = build_timeline(*args)
+    profile.add_time("timeline_lookup", started)
+    profile.timeline_cache["hits" if build_timeline.cache_info().hits > hits else "misses"] += 1
+    return timeline
+
+def add_item_events(add, first_actual_damage_time, sim_duration, has_hits, has_liandrys_flag, has_haunting_guise_flag,
+                    has_alternator_flag, has_fated_ashes_flag, round_time=round):
+    # The item-driven events every timeline gets after the combo's own hits: the alternator proc, the Liandry/Haunting
+    # amp tiers and the Liandry/Fated Ashes burn ticks. Times and durations are scalars (round_time=round) or
+    # per-sample arrays (round_time=np.round); add(time, type, amp_value=0, keep=True) drops events where keep is False.
+    if has_alternator_flag and has_hits: add(first_actual_damage_time, 'ALTERNATOR_PROC')
+    if has_liandrys_flag or has_haunting_guise_flag:
+        amp_data = ITEM_STATS["Liandry's Torment"]
+        amp_vals = [1.0, 1.0, 1.0]
+        if has_liandrys_flag: amp_vals = [v*amp_data[k] for v,k in zip(amp_vals, ["amp_level_1_value","amp_level_2_value","amp_level_3_value"])]
+        if has_haunting_guise_flag: amp_vals = [v*amp_data[k] for v,k in zip(amp_vals, ["amp_level_1_value","amp_level_2_value","amp_level_3_value"])]
+        trigger_time = round_time(first_actual_damage_time + amp_data["amp_trigger_delay"], 2)
+        add(round_time(trigger_time-0.01, 2), 'AMP_CHANGE', amp_vals[0])
+        add(round_time(trigger_time+amp_data["amp_tier_1_relative_time"]-0.01, 2), 'AMP_CHANGE', amp_vals[1])
+        add(round_time(trigger_time+amp_data["amp_tier_2_relative_time"]-0.01, 2), 'AMP_CHANGE', amp_vals[2])
+
+    for has_burn, item_name, burn_type in ((has_liandrys_flag, "Liandry's Torment", 'LIANDRYS_BURN'), (has_fated_ashes_flag, "Fated Ashes", 'FATED_ASHES_BURN')):
+        if not has_burn: continue
+        burn = ITEM_STATS[item_name]
+        burn_start_time = round_time(first_actual_damage_time + burn["burn_initial_delay"], 2)
+        num_burns = np.floor((sim_duration - burn_start_time) / burn["burn_tick_interval"])
+        for i in range(max(int(np.max(num_burns)) + 1, 0)):
+            tick_time = round_time(burn_start_time + (i * burn["burn_tick_interval"]), 2)
+            add(tick_time, burn_type, keep=(i <= num_burns) & (tick_time <= sim_duration))
+
+@lru_cache(maxsize=1024)
+def build_timeline(combo_type, has_liandrys_flag, has_haunting_guise_flag, has_alternator_flag, has_fated_ashes_flag,
+                   total_simulation_duration_for_this_build):
+    # Merges the item-driven events into the combo schedule once per item-flag set and duration.
+    # Events are (time, step, type, amp_value, is_final), sorted by time with ties kept in insertion order,
+    # and step is the TIME_STEP tick the stepped clock would have processed the event in.
+    profile = get_active_profile()
+    if profile is not None: started = time.perf_counter()
+    hits, base_duration = compile_combo_schedule(combo_type)
+    damage_events = [(hit_time, ability, 0, is_final) for hit_time, ability, is_final in hits]
+    def add(event_time, e_type, amp_value=0, keep=True):
+        if keep: damage_events.append((event_time, e_type, amp_value, False))
+    first_actual_damage_time = min(hit[0] for hit in hits) if hits else 0.0
+    add_item_events(add, first_actual_damage_time, total_simulation_duration_for_this_build, bool(hits), has_liandrys_flag,
+                    has_haunting_guise_flag, has_alternator_flag, has_fated_ashes_flag)
+
+    if profile is not None: started = profile.add_time("build", started)
+    damage_events.sort(key=lambda event: event[0])
+    if profile is not None: profile.add_time("sort", started)
+    events, last_step = [], 0
+    for event_time, e_type, amp_value, is_final in damage_events:
+        last_step = max(last_step, event_step_index(event_time))
+        events.append((event_time, last_step, e_type, amp_value, is_final))
+    max_event_time = damage_events[-1][0] if damage_events else 0.0
+    sim_loop_duration = max(total_simulation_duration_for_this_build, max_event_time) + TIME_STEP
+    num_steps = int(sim_loop_duration/TIME_STEP)+1
+    # Sum of the Liandry/Haunting amp each (type, is_final) lands under, for the closed-form total
+    amp_weights, global_amp = {}, 1.0
+    for _, step, e_type, amp_value, is_final in events:
+        if step >= num_steps: break
+        if e_type == 'AMP_CHANGE': global_amp = amp_value
+        else: amp_weights[(e_type, is_final)] = amp_weights.get((e_type, is_final), 0.0) + global_amp
+    return CompiledTimeline(tuple(events), num_steps, base_duration, tuple(amp_weights.items()))
+
+def clear_compiled_timelines():
+    compile_combo_schedule.cache_clear(); build_timeline.cache_clear()
+
+def process_damage_events(timeline, prepared, enemy_current_hp, has_shadowflame_flag=False, stop_at_kill=False):
+    # Walks the compiled events in time order and only evaluates HP-dependent state when something happens.
+    # Events sharing a TIME_STEP tick share the Shadowflame amp taken at the start of that tick.
+    # Returns (total, hp, breakpoints, kill_time); kill_time is None if the enemy survives, and stop_at_kill ends there.
+    profile = get_active_profile()
+    if profile is not None: started = time.perf_counter()
+    current_enemy_hp, total_damage_dealt = enemy_current_hp, 0.0
+    global_amp, shadowflame_amp = 1.0, 1.0
+    breakpoints, last_step, kill_time = [], -1, None
+    for event_time, step, e_type, amp_value, is_final in timeline.events:
+        if step >= timeline.num_steps: break
+        if step != last_step:
+            if last_step >= 0: breakpoints.append((last_step, total_damage_dealt, current_enemy_hp))
+            last_step = step
+            if has_shadowflame_flag:
+                shadowflame_amp = prepared.shadowflame_amp_value if current_enemy_hp <= prepared.shadowflame_threshold_hp else 1.0
+        if e_type == 'AMP_CHANGE':
+            global_amp = amp_value
+            if profile is not None: profile.record_event(event_time, e_type, 0.0, global_amp, shadowflame_amp, current_enemy_hp)
+            continue
+        raw_dmg = EVENT_HANDLERS[e_type](prepared, current_enemy_hp, is_final)
+        if raw_dmg > 0:
+            final_damage = raw_dmg * global_amp * shadowflame_amp
+            total_damage_dealt += final_damage
+            current_enemy_hp = max(0, current_enemy_hp - final_damage)
+        if profile is not None: profile.record_event(event_time, e_type, raw_dmg, global_amp, shadowflame_amp, current_enemy_hp)
+        if kill_time is None and current_enemy_hp <= 0:
+            kill_time = event_time
+            if stop_at_kill: break
+    if last_step >= 0: breakpoints.append((last_step, total_damage_dealt, current_enemy_hp))
+    if profile is not None: profile.add_time("step", started)
+    return total_damage_dealt, current_enemy_hp, breakpoints, kill_time
+
+def iter_timeline_events(timeline):
+    # Compiled events in the form process_lane_events takes, up to the end of the simulated window
+    for event_time, step, e_type, amp_value, is_final in timeline.events:
+        if step >= timeline.num_steps: return
+        yield event_time, step, e_type, amp_value, is_final, None
+
+def process_lane_events(events, prepared, current_enemy_hp, has_shadowflame_flag=False, lane_mask=None, track_kill_time=False,
+                        global_amp=1.0):
+    # process_damage_events for lane arrays (MR sweeps and grids, teamfight enemies, Monte Carlo samples), with the same
+    # amp and Shadowflame rules; it stays scalar there because plain floats are much faster for one lane.
+    # events yields (event_time, step, type, amp_value, is_final, lanes): event_time, step and amp_value may be per-lane
+    # arrays, and lanes (None for all) limits an event to some lanes so each Monte Carlo sample can follow its own
+    # timeline. lane_mask(e_type, is_final, current_enemy_hp), if given, picks the lanes each damage event may hit.
+    # global_amp is the Liandry/Haunting amp in effect before the first event (for streams resumed part way through).
+    # Returns (total_damage, final_hp, kill_time); kill_time is NaN for lanes that survive, or None if not tracked.
+    total_damage_dealt = np.zeros(np.shape(current_enemy_hp))
+    kill_time = np.full(np.shape(current_enemy_hp), np.nan) if track_kill_time else None
+    shadowflame_amp, last_step = 1.0, -1
+    for event_time, step, e_type, amp_value, is_final, lanes in events:
+        if has_shadowflame_flag:
+            # Each lane takes the amp from its own HP at the start of each of its TIME_STEP ticks
+            refresh = step != last_step if lanes is None else lanes & (step != last_step)
+            if np.any(refresh):
+                shadowflame_amp = np.where(refresh, np.where(current_enemy_hp <= prepared.shadowflame_threshold_hp, prepared.shadowflame_amp_value, 1.0), shadowflame_amp)
+            last_step = step if lanes is None else np.where(lanes, step, last_step)
+        if e_type == 'AMP_CHANGE':
+            global_amp = amp_value if lanes is None else np.where(lanes, amp_value, global_amp)
+            continue
+        raw_dmg = LANE_EVENT_HANDLERS[e_type](prepared, current_enemy_hp, is_final)
+        dealt = raw_dmg > 0
+        if lanes is not None: dealt = dealt & lanes
+        if lane_mask is not None: dealt = dealt & lane_mask(e_type, is_final, current_enemy_hp)
+        final_damage = raw_dmg * global_amp * shadowflame_amp
+        total_damage_dealt = np.where(dealt, total_damage_dealt + final_damage, total_damage_dealt)
+        current_enemy_hp = np.where(dealt, np.maximum(0, current_enemy_hp - final_damage), current_enemy_hp)
+        if track_kill_time: kill_time = np.where(np.isnan(kill_time) & (current_enemy_hp <= 0), event_time, kill_time)
+    return total_damage_dealt, current_enemy_hp, kill_time
+
+def reads_enemy_hp(prepared, e_type, is_final):
+    return (e_type == 'Q' and prepared.q_health_percent is not None) or \
+        (e_type == 'W' and is_final and prepared.w_missing_health_percent is not None)
+
+def calculate_analytic_damage(timeline, prepared, has_shadowflame_flag=False):
+    # Without Q, W's missing-HP tick or Shadowflame no event depends on HP, so the total is just each prepared
+    # damage times the amp it lands under. Returns None when the event loop is needed. Works on prepared arrays too.
+    if has_shadowflame_flag: return None
+    if any(reads_enemy_hp(prepared, e_type, is_final) for (e_type, is_final), _ in timeline.amp_weights): return None
+    return sum_amp_weighted_damage(timeline.amp_weights, prepared)
+
+def sum_amp_weighted_damage(amp_weights, prepared):
+    total_damage_dealt = 0.0
+    for (e_type, is_final), amp_weight in amp_weights:
+        total_damage_dealt = total_damage_dealt + EVENT_HANDLERS[e_type](prepared, None, is_final) * amp_weight
+    return total_damage_dealt
+
+# --- 6a. Compact Result Series ---
+SERIES_MODES = ("dense", "breakpoints", "downsampled")
+
+@lru_cache(maxsize=256)
+def dense_time_axis(num_steps):
+    return tuple(round(step*TIME_STEP, 2) for step in range(num_steps))
+
+def build_series(breakpoints, num_steps, enemy_current_hp, mode="dense", typecode="d", max_points=200):
+    # Packs the damage/HP curves into typed arrays ('d' float64 or 'f' float32). "dense" has one point per
+    # TIME_STEP, "breakpoints" only the ticks where something happened plus both ends (draw it as a step
+    # function), and "downsampled" strides the dense series down to at most max_points, keeping the last point.
+    if mode not in SERIES_MODES: raise ValueError(f"Unknown series mode: {mode}")
+    if mode == "breakpoints":
+        points = list(breakpoints)
+        if not points or points[0][0] > 0: points.insert(0, (0, 0.0, enemy_current_hp))
+        if points[-1][0] < num_steps - 1: points.append((num_steps - 1, points[-1][1], points[-1][2]))
+        time_axis = dense_time_axis(num_steps)
+        return (array(typecode, [time_axis[step] for step, _, _ in points]),
+                array(typecode, [total for _, total, _ in points]), array(typecode, [hp for _, _, hp in points]))
+    damage_log, hp_log = array(typecode), array(typecode)
+    total_damage_dealt, current_enemy_hp, last_step = 0.0, enemy_current_hp, 0
+    for step, next_total, next_hp in breakpoints:
+        damage_log.extend(array(typecode, [total_damage_dealt]) * (step - last_step)); hp_log.extend(array(typecode, [current_enemy_hp]) * (step - last_step))
+        total_damage_dealt, current_enemy_hp, last_step = next_total, next_hp, step
+    damage_log.extend(array(typecode, [total_damage_dealt]) * (num_steps - last_step)); hp_log.extend(array(typecode, [current_enemy_hp]) * (num_steps - last_step))
+    time_points = array(typecode, dense_time_axis(num_steps))
+    if mode == "downsampled" and num_steps > max_points:
+        stride = math.ceil((num_steps - 1) / (max(max_points, 2) - 1))
+        keep = list(range(0, num_steps, stride))
+        if keep[-1] != num_steps - 1: keep.append(num_steps - 1)
+        time_points, damage_log, hp_log = (array(typecode, [values[i] for i in keep]) for values in (time_points, damage_log, hp_log))
+    return time_points, damage_log, hp_log
+
+def simulate_damage_events(combo_type, e_level, w_level, q_level, r_level,
+                            enemy_max_hp, enemy_current_hp, enemy_mr,
+                            total_ap, total_flat_mpen, total_percent_mpen, is_q_feared=False,
+                            has_liandrys_flag=False, has_shadowflame_flag=False,
+                            has_haunting_guise_flag=False, has_alternator_flag=False,
+                            has_fated_ashes_flag=False,
+                            w_ap_ratio_override=None,
+                            total_simulation_duration_for_this_build=0.0):
+    # Returns (total_damage, final_hp, breakpoints, num_steps); breakpoints are (step, total_damage, hp) per event tick
+    timeline = compile_timeline(combo_type, has_liandrys_flag, has_haunting_guise_flag, has_alternator_flag,
+                                has_fated_ashes_flag, total_simulation_duration_for_this_build)
+    damage_multiplier = 1 - calculate_magic_damage_reduction(calculate_effective_mr(enemy_mr, total_flat_mpen, total_percent_mpen))
+    prepared = prepare_scenario(e_level, w_level, q_level, r_level, enemy_max_hp, damage_multiplier, total_ap,
+                                is_q_feared, w_ap_ratio_override)
+    total_damage_dealt, current_enemy_hp, breakpoints, _ = process_damage_events(timeline, prepared, enemy_current_hp, has_shadowflame_flag)
+    return total_damage_dealt, current_enemy_hp, breakpoints, timeline.num_steps
+
+def simulate_damage_total(combo_type, e_level, w_level, q_level, r_level,
+                          enemy_max_hp, enemy_current_hp, enemy_mr,
+                          total_ap, total_flat_mpen, total_percent_mpen, is_q_feared=False,
+                          has_liandrys_flag=False, has_shadowflame_flag=False,
+                          has_haunting_guise_flag=False, has_alternator_flag=False,
+                          has_fated_ashes_flag=False,
+                          w_ap_ratio_override=None,
+                          total_simulation_duration_for_this_build=0.0):
+    # (total_damage, final_hp) only: closed form when nothing reads HP, otherwise the event loop
+    timeline = compile_timeline(combo_type, has_liandrys_flag, has_haunting_guise_flag, has_alternator_flag,
+                                has_fated_ashes_flag, total_simulation_duration_for_this_build)
+    damage_multiplier = 1 - calculate_magic_damage_reduction(calculate_effective_mr(enemy_mr, total_flat_mpen, total_percent_mpen))
+    prepared = prepare_scenario(e_level, w_level, q_level, r_level, enemy_max_hp, damage_multiplier, total_ap,
+                                is_q_feared, w_ap_ratio_override)
+    # The closed form has no events to attribute, so profiled runs always take the event loop
+    total_damage_dealt = calculate_analytic_damage(timeline, prepared, has_shadowflame_flag) if get_active_profile() is None else None
+    if total_damage_dealt is not None: return total_damage_dealt, max(0, enemy_current_hp - total_damage_dealt)
+    total_damage_dealt, current_enemy_hp, _, _ = process_damage_events(timeline, prepared, enemy_current_hp, has_shadowflame_flag)
+    return total_damage_dealt, current_enemy_hp
+
+def simulate_damage_over_time(combo_type, e_level, w_level, q_level, r_level,
+                              enemy_max_hp, enemy_current_hp, enemy_mr,
+                              total_ap, total_flat_mpen, total_percent_mpen, is_q_feared=False,
+                              has_liandrys_flag=False, has_shadowflame_flag=False,
+                              has_haunting_guise_flag=False, has_alternator_flag=False,
+                              has_fated_ashes_flag=False,
+                              w_ap_ratio_override=None,
+                              total_simulation_duration_for_this_build=0.0,
+                              dense_series=True):
+    if not dense_series:
+        total_damage_dealt, current_enemy_hp = simulate_damage_total(
+            combo_type, e_level, w_level, q_level, r_level, enemy_max_hp, enemy_current_hp, enemy_mr,
+            total_ap, total_flat_mpen, total_percent_mpen, is_q_feared, has_liandrys_flag, has_shadowflame_flag,
+            has_haunting_guise_flag, has_alternator_flag, has_fated_ashes_flag, w_ap_ratio_override,
+            total_simulation_duration_for_this_build
+        )
+        return total_damage_dealt, current_enemy_hp, [], [], []
+    total_damage_dealt, current_enemy_hp, breakpoints, num_steps = simulate_damage_events(
+        combo_type, e_level, w_level, q_level, r_level, enemy_max_hp, enemy_current_hp, enemy_mr,
+        total_ap, total_flat_mpen, total_percent_mpen, is_q_feared, has_liandrys_flag, has_shadowflame_flag,
+        has_haunting_guise_flag, has_alternator_flag, has_fated_ashes_flag, w_ap_ratio_override,
+        total_simulation_duration_for_this_build
+    )
+    # Plain lists, as this function has always returned
+    time_points, damage_log, hp_log = (values.tolist() for values in build_series(breakpoints, num_steps, enemy_current_hp, "dense"))
+    return total_damage_dealt, current_enemy_hp, time_points, damage_log, hp_log
+
+def simulate_damage_batch(combo_type, e_level, w_level, q_level, r_level,
+                          enemy_max_hp, enemy_current_hp, damage_multipliers, total_ap, is_q_feared=False,
+                          has_liandrys_flag=False, has_shadowflame_flag=False,
+                          has_haunting_guise_flag=False, has_alternator_flag=False,
+                          has_fated_ashes_flag=False,
+                          w_ap_ratio_override=None,
+                          total_simulation_duration_for_this_build=0.0,
+                          track_kill_time=False):
+    # Runs one combo timeline over many lanes at once. Any of enemy_max_hp, enemy_current_hp, damage_multipliers
+    # and total_ap may be an array (they broadcast together); each lane keeps its own HP so the Q/W/Shadowflame
+    # HP terms match simulate_damage_over_time exactly. Returns (total_damage, final_hp, kill_time) arrays;
+    # kill_time is the time of the event that dropped a lane to 0 HP (NaN if it survived), or None if not tracked.
+    timeline = compile_timeline(combo_type, has_liandrys_flag, has_haunting_guise_flag, has_alternator_flag,
+                                has_fated_ashes_flag, total_simulation_duration_for_this_build)
+    prepared = prepare_scenario(e_level, w_level, q_level, r_level, enemy_max_hp, damage_multipliers, total_ap,
+                                is_q_feared, w_ap_ratio_override)
+    shape = np.broadcast_shapes(np.shape(enemy_max_hp), np.shape(enemy_current_hp), np.shape(damage_multipliers), np.shape(total_ap))
+    current_enemy_hp = np.broadcast_to(np.asarray(enemy_current_hp, dtype=float), shape).copy()
+    if not track_kill_time:
+        analytic_total = calculate_analytic_damage(timeline, prepared, has_shadowflame_flag)
+        if analytic_total is not None:
+            total_damage_dealt = np.broadcast_to(np.asarray(analytic_total, dtype=float), shape).copy()
+            return total_damage_dealt, np.maximum(0, current_enemy_hp - total_damage_dealt), None
+    return process_lane_events(iter_timeline_events(timeline), prepared, current_enemy_hp, has_shadowflame_flag,
+                               track_kill_time=track_kill_time)
+
+def simulate_damage_mr_sweep(combo_type, e_level, w_level, q_level, r_level,
+                             enemy_max_hp, enemy_current_hp, enemy_mr_values,
+                             total_ap, total_flat_mpen, total_percent_mpen, is_q_feared=False,
+                             has_liandrys_flag=False, has_shadowflame_flag=False,
+                             has_haunting_guise_flag=False, has_alternator_flag=False,
+                             has_fated_ashes_flag=False,
+                             w_ap_ratio_override=None,
+                             total_simulation_duration_for_this_build=0.0):
+    # One lane per MR value; returns (total_damage, final_hp) arrays
+    profile = get_active_profile()
+    if profile is not None: started = time.perf_counter()
+    total_damage_dealt, current_enemy_hp, _ = simulate_damage_batch(
+        combo_type, e_level, w_level, q_level, r_level, enemy_max_hp, enemy_current_hp,
+        calculate_damage_multipliers(enemy_mr_values, total_flat_mpen, total_percent_mpen), total_ap, is_q_feared,
+        has_liandrys_flag, has_shadowflame_flag, has_haunting_guise_flag, has_alternator_flag, has_fated_ashes_flag,
+        w_ap_ratio_override, total_simulation_duration_for_this_build
+    )
+    if profile is not None: profile.add_time("mr_sweep", started)
+    return total_damage_dealt, current_enemy_hp
+
+def get_simulation_duration(combo, item_stats):
+    _, base_duration = compile_combo_schedule(combo)
+    sim_duration = base_duration
+    if item_stats["has_liandrys"] or item_stats["has_fated_ashes"]:
+        sim_duration += ITEM_STATS["Liandry's Torment"]["extension_duration_after_combo"]
+    return sim_duration
+
+def result_cache_key(items, q, w, e, r, max_hp, mr, combo, feared, w_ratio_override=None, mr_values=None,
+                     series="dense", series_typecode="d", max_points=200):
+    return (tuple(sorted(items)), q, w, e, r, max_hp, mr, combo, bool(feared), w_ratio_override,
+            tuple(mr_values) if mr_values is not None else None, series, series_typecode, max_points)
+
+def run_and_get_results(items, q, w, e, r, max_hp, mr, combo, feared, w_ratio_override=None, mr_values=None,
+                        series="dense", series_typecode="d", max_points=200):
+    key = result_cache_key(items, q, w, e, r, max_hp, mr, combo, feared, w_ratio_override, mr_values,
+                           series, series_typecode, max_points)
+    # A cache hit would run nothing, so profiled calls always simulate (and still refresh the cache)
+    profiled = get_active_profile() is not None
+    results = RESULT_CACHE.get(key) if not profiled else None
+    if results is None:
+        store = get_result_store() if not profiled else None
+        if store is not None: results = store.get(key, get_data_version())
+        if results is None:
+            results = compute_results(items, q, w, e, r, max_hp, mr, combo, feared, w_ratio_override, mr_values,
+                                      series, series_typecode, max_points)
+        RESULT_CACHE.put(key, results)
+    # Copy so callers can relabel build_name without touching the cached entry
+    return dict(results, build_name=", ".join(items) if items else "No Items")
+
+def compute_results(items, q, w, e, r, max_hp, mr, combo, feared, w_ratio_override=None, mr_values=None,
+                    series="dense", series_typecode="d", max_points=200):
+    # series is one of SERIES_MODES, or None to skip the time series entirely
+    item_stats = get_stats_from_items(items)
+    sim_duration = get_simulation_duration(combo, item_stats)
+
+    simulate = simulate_damage_events if series is not None else simulate_damage_total
+    simulated = simulate(
+        combo, e, w, q, r, max_hp, max_hp, mr,
+        item_stats["total_ap"], item_stats["total_flat_mpen"], item_stats["total_percent_mpen"],
+        feared, item_stats["has_liandrys"], item_stats["has_shadowflame"],
+        item_stats["has_haunting_guise"], item_stats["has_alternator"], 
+        item_stats["has_fated_ashes"], w_ratio_override, sim_duration
+    )
+    total_damage, final_hp = simulated[:2]
+    time_points, damage_log, hp_log = array(series_typecode), array(series_typecode), array(series_typecode)
+    if series is not None: time_points, damage_log, hp_log = build_series(simulated[2], simulated[3], max_hp, series, series_typecode, max_points)
+    dps = total_damage / sim_duration if sim_duration > 0 else 0
+    if mr_values is None: mr_values = list(range(0, 201, 5))
+    damage_vs_mr = np.zeros(0)
+    if len(mr_values):
+        damage_vs_mr, _ = simulate_damage_mr_sweep(
+            combo, e, w, q, r, max_hp, max_hp, mr_values,
+            item_stats["total_ap"], item_stats["total_flat_mpen"], item_stats["total_percent_mpen"],
+            feared, item_stats["has_liandrys"], item_stats["has_shadowflame"],
+            item_stats["has_haunting_guise"], item_stats["has_alternator"],
+            item_stats["has_fated_ashes"], w_ratio_override, sim_duration
+        )
+
+    results = {
+        "total_damage": total_damage, "final_hp": final_hp, "dps": dps,
+        "time_points": np.frombuffer(time_points, dtype=series_typecode), "damage_log": np.frombuffer(damage_log, dtype=series_typecode),
+        "hp_log": np.frombuffer(hp_log, dtype=series_typecode), "series": series,
+        "mr_values": np.array(mr_values, dtype=float), "damage_vs_mr": np.array(damage_vs_mr, dtype=float),
+        "reported_duration": sim_duration
+    }
+    # Read-only numpy arrays, the same type ResultStore.get returns, so results look alike whichever path produced them
+    for field in RESULT_ARRAY_FIELDS: results[field].flags.writeable = False
+    return results
+
+# --- 6b. Grid Sweeps ---
+GRID_CHUNK_SIZE = 16384  # lanes per batch; bounds the working arrays regardless of grid size
+
+def iter_damage_grid_chunks(items, q, w, e, r, combo, feared, max_hp_values, mr_values, bonus_ap_values=None,
+                            w_ratio_override=None, time_to_kill=False, chunk_size=GRID_CHUNK_SIZE):
+    # Walks the flattened (max_hp, mr[, bonus_ap]) grid in C order and yields (start, stop, total_damage, kill_time)
+    # per chunk. Bonus AP is added to the build's total AP as-is (no Rabadon scaling).
+    item_stats = get_stats_from_items(items)
+    sim_duration = get_simulation_duration(combo, item_stats)
+    hp_axis, mr_axis = np.asarray(max_hp_values, dtype=float), np.asarray(mr_values, dtype=float)
+    ap_axis = np.asarray(bonus_ap_values if bonus_ap_values is not None else [0.0], dtype=float)
+    shape = (len(hp_axis), len(mr_axis), len(ap_axis))
+    lane_count = shape[0] * shape[1] * shape[2]
+    for start in range(0, lane_count, chunk_size):
+        stop = min(start + chunk_size, lane_count)
+        hp_index, mr_index, ap_index = np.unravel_index(np.arange(start, stop), shape)
+        max_hp = hp_axis[hp_index]
+        total_damage, _, kill_time = simulate_damage_batch(
+            combo, e, w, q, r, max_hp, max_hp,
+            calculate_damage_multipliers(mr_axis[mr_index], item_stats["total_flat_mpen"], item_stats["total_percent_mpen"]),
+            item_stats["total_ap"] + ap_axis[ap_index],
+            feared, item_stats["has_liandrys"], item_stats["has_shadowflame"],
+            item_stats["has_haunting_guise"], item_stats["has_alternator"],
+            item_stats["has_fated_ashes"], w_ratio_override, sim_duration, time_to_kill
+        )
+        yield start, stop, total_damage, kill_time
+
+def compute_damage_grid(items, q, w, e, r, combo, feared, max_hp_values, mr_values, bonus_ap_values=None,
+                        w_ratio_override=None, time_to_kill=False, chunk_size=GRID_CHUNK_SIZE):
+    # Returns total_damage (and time_to_kill, NaN where the target survives) shaped (hp, mr) or (hp, mr, bonus_ap)
+    shape = (len(max_hp_values), len(mr_values)) + ((len(bonus_ap_values),) if bonus_ap_values is not None else ())
+    damage_grid = np.empty(shape)
+    ttk_grid = np.empty(shape) if time_to_kill else None
+    for start, stop, total_damage, kill_time in iter_damage_grid_chunks(
+            items, q, w, e, r, combo, feared, max_hp_values, mr_values, bonus_ap_values,
+            w_ratio_override, time_to_kill, chunk_size):
+        damage_grid.reshape(-1)[start:stop] = total_damage
+        if time_to_kill: ttk_grid.reshape(-1)[start:stop] = kill_time
+    return {
+        "max_hp_values": np.asarray(max_hp_values, dtype=float), "mr_values": np.asarray(mr_values, dtype=float),
+        "bonus_ap_values": np.asarray(bonus_ap_values, dtype=float) if bonus_ap_values is not None else None,
+        "total_damage": damage_grid, "time_to_kill": ttk_grid,
+        "reported_duration": get_simulation_duration(combo, get_stats_from_items(items))
+    }
+
+# --- 6c. Monte Carlo Timing ---
+# Delay specs: a number (fixed seconds), ("fixed", s), ("uniform", low, high), ("normal", mean, sd) or
+# ("lognormal", mean, sigma) of the underlying normal. Samples are clipped at 0 so casts never land early.
+MONTE_CARLO_CHUNK_SIZE = 4096
+EVENT_CODES = {'AMP_CHANGE': 0, 'E': 1, 'Q': 2, 'W': 3, 'R': 4, 'LIANDRYS_BURN': 5, 'ALTERNATOR_PROC': 6, 'FATED_ASHES_BURN': 7}
+EVENT_TYPES = {code: e_type for e_type, code in EVENT_CODES.items()}
+PAD_EVENT_CODE = -1
+
+def sample_delays(rng, spec, size):
+    if spec is None: return np.zeros(size)
+    if isinstance(spec, (int, float)): return np.full(size, float(spec))
+    kind, *params = spec
+    if kind == "fixed": values = np.full(size, float(params[0]))
+    elif kind == "uniform": values = rng.uniform(params[0], params[1], size)
+    elif kind == "normal": values = rng.normal(params[0], params[1], size)
+    elif kind == "lognormal": values = rng.lognormal(params[0], params[1], size)
+    else: raise ValueError(f"Unknown delay distribution: {kind!r}")
+    return np.maximum(values, 0.0)
+
+def event_step_indices(event_times):
+    # Vector form of event_step_index
+    steps = np.maximum(0, ((event_times - TIME_STEP) / TIME_STEP).astype(np.int64))
+    while True:
+        clock = np.round(steps * TIME_STEP, 2)
+        behind = (clock < event_times) & (np.abs(clock - event_times) > np.maximum(1e-9 * np.maximum(np.abs(clock), np.abs(event_times)), TIME_STEP / 2))
+        if not behind.any(): return steps
+        steps = steps + behind
+
+def build_sampled_events(combo_type, cast_delays, has_liandrys_flag, has_haunting_guise_flag, has_alternator_flag,
+                         has_fated_ashes_flag, total_simulation_duration_for_this_build):
+    # compile_timeline for a batch of perturbed casts: cast_delays is (samples, schedule steps) and each cast is pushed
+    # back by its own delay plus every earlier one. Returns padded (samples, events) arrays sorted by time like
+    # compile_timeline (ties keep insertion order), plus each sample's stretched duration and step count.
+    schedule, samples = COMBO_SCHEDULES.get(combo_type), cast_delays.shape[0]
+    times, codes, amps, finals = [], [], [], []
+    def add(time_column, e_type, amp_value=0.0, is_final=False, keep=True):
+        # Dropped events stay as padding (time inf) so every sample keeps the same columns
+        times.append(time_column if keep is True else np.where(keep, time_column, np.inf))
+        codes.append(EVENT_CODES[e_type]); amps.append(amp_value); finals.append(is_final)
+
+    cumulative_delay = np.cumsum(cast_delays, axis=1) if cast_delays.shape[1] else np.zeros((samples, 0))
+    last_hit_time = np.zeros(samples)
+    for index, (ability, anchor, ticks, interval) in enumerate(schedule["steps"] if schedule else []):
+        if ticks is None: ticks = ABILITY_DATA[ABILITY_KEYS[ability]][TICK_COUNT_FIELDS[ability]] if ability in TICK_COUNT_FIELDS else 1
+        shift = cast_delays[:, index] if anchor == "prev" else cumulative_delay[:, index]
+        first_hit = np.round((last_hit_time if anchor == "prev" else anchor) + ABILITY_DATA[ABILITY_KEYS[ability]]["cast_time"] + shift, 2)
+        for i in range(ticks):
+            last_hit_time = np.round(first_hit + (i*interval), 2)
+            add(last_hit_time, ability, is_final=i == ticks - 1)
+    total_delay = cumulative_delay[:, -1] if cumulative_delay.shape[1] else np.zeros(samples)
+    sim_duration = total_simulation_duration_for_this_build + total_delay
+
+    first_actual_damage_time = np.min(times, axis=0) if times else np.zeros(samples)
+    add_item_events(add, first_actual_damage_time, sim_duration, bool(times), has_liandrys_flag, has_haunting_guise_flag,
+                    has_alternator_flag, has_fated_ashes_flag, round_time=np.round)
+
+    event_times = np.stack(times, axis=1) if times else np.zeros((samples, 0))
+    order = np.argsort(event_times, axis=1, kind="stable")
+    event_times = np.take_along_axis(event_times, order, axis=1)
+    event_codes = np.where(np.isinf(event_times), PAD_EVENT_CODE, np.array(codes, dtype=np.int64)[order])
+    event_amps, event_finals = np.array(amps)[order], np.array(finals, dtype=bool)[order]
+    padded = np.isinf(event_times)
+    event_steps = np.maximum.accumulate(event_step_indices(np.where(padded, 0.0, event_times)), axis=1) if times else np.zeros((samples, 0), dtype=np.int64)
+    max_event_time = np.max(np.where(padded, 0.0, event_times), axis=1, initial=0.0)
+    num_steps = ((np.maximum(sim_duration, max_event_time) + TIME_STEP) / TIME_STEP).astype(np.int64) + 1
+    event_codes = np.where(event_steps >= num_steps[:, None], PAD_EVENT_CODE, event_codes)
+    return event_times, event_steps, event_codes, event_amps, event_finals, sim_duration
+
+def iter_sampled_events(event_times, event_steps, event_codes, event_amps, event_finals):
+    # Column k holds every sample's k-th event; it is split into one event per (type, is_final) present, limited to
+    # the samples that have it. Those lane sets are disjoint, so their order within the column does not matter.
+    for k in range(event_times.shape[1]):
+        keys = event_codes[:, k] * 2 + event_finals[:, k] - 2 * PAD_EVENT_CODE
+        counts = np.bincount(keys)
+        present = [key for key in np.flatnonzero(counts) if key >= 2]
+        if not present: return
+        for key in present:
+            code, is_final = divmod(int(key) + 2 * PAD_EVENT_CODE, 2)
+            lanes = None if counts[key] == len(keys) else keys == key
+            yield event_times[:, k], event_steps[:, k], EVENT_TYPES[code], event_amps[:, k], bool(is_final), lanes
+
+def simulate_sampled_events(event_times, event_steps, event_codes, event_amps, event_finals, prepared,
+                            enemy_current_hp, has_shadowflame_flag=False):
+    # process_lane_events with one lane per sample. Returns (total, hp, kill_time).
+    return process_lane_events(iter_sampled_events(event_times, event_steps, event_codes, event_amps, event_finals), prepared,
+                               np.full(event_times.shape[0], float(enemy_current_hp)), has_shadowflame_flag, track_kill_time=True)
+
+def iter_monte_carlo(items, q, w, e, r, max_hp, mr, combo, cast_delay=("normal", 0.1, 0.03), fear_uptime=1.0,
+                     samples=10000, w_ratio_override=None, percentiles=(5, 25, 50, 75, 95), histogram_edges=None,
+                     chunk_size=MONTE_CARLO_CHUNK_SIZE, seed=None):
+    # Samples cast delays (one spec for every cast, or {ability: spec}) and whether Q lands on a feared target,
+    # then yields a running summary after each chunk so callers can stream percentiles and the histogram.
+    # histogram_edges are fixed up front (e.g. np.linspace(0, max_hp * 2, 51)) so counts can accumulate per chunk.
+    if samples < 1: raise ValueError(f"samples must be at least 1, got {samples}")
+    rng = np.random.default_rng(seed)
+    item_stats = get_stats_from_items(items)
+    base_duration = get_simulation_duration(combo, item_stats)
+    schedule = COMBO_SCHEDULES.get(combo)
+    steps = schedule["steps"] if schedule else []
+    damage_multiplier = 1 - calculate_magic_damage_reduction(calculate_effective_mr(mr, item_stats["total_flat_mpen"], item_stats["total_percent_mpen"]))
+    prepared = prepare_scenario(e, w, q, r, max_hp, damage_multiplier, item_stats["total_ap"], True, w_ratio_override)
+    histogram = np.zeros(len(histogram_edges) - 1, dtype=np.int64) if histogram_edges is not None else None
+    damage_samples, ttk_samples, dps_samples = np.empty(samples), np.empty(samples), np.empty(samples)
+
+    for start in range(0, samples, chunk_size):
+        count = min(chunk_size, samples - start)
+        cast_delays = np.column_stack([sample_delays(rng, cast_delay.get(ability) if isinstance(cast_delay, dict) else cast_delay, count)
+                                       for ability, _, _, _ in steps]) if steps else np.zeros((count, 0))
+        feared = rng.random(count) < fear_uptime
+        chunk_prepared = prepared._replace(q_feared_multiplier=np.where(feared, ABILITY_DATA["Q_Terrify"]["feared_multiplier"], 1.0))
+        *events, sim_duration = build_sampled_events(
+            combo, cast_delays, item_stats["has_liandrys"], item_stats["has_haunting_guise"],
+            item_stats["has_alternator"], item_stats["has_fated_ashes"], base_duration)
+        total_damage, _, kill_time = simulate_sampled_events(*events, chunk_prepared, max_hp, item_stats["has_shadowflame"])
+        damage_samples[start:start + count], ttk_samples[start:start + count] = total_damage, kill_time
+        dps_samples[start:start + count] = np.where(sim_duration > 0, total_damage / np.where(sim_duration > 0, sim_duration, 1.0), 0.0)
+        if histogram is not None: histogram += np.histogram(total_damage, bins=histogram_edges)[0]
+        yield summarize_monte_carlo(damage_samples[:start + count], dps_samples[:start + count], ttk_samples[:start + count],
+                                    percentiles, histogram, histogram_edges)
+
+def summarize_monte_carlo(damage_samples, dps_samples, ttk_samples, percentiles, histogram=None, histogram_edges=None):
+    killed = ttk_samples[~np.isnan(ttk_samples)]
+    return {
+        "samples": len(damage_samples), "mean_damage": float(damage_samples.mean()),
+        "damage_percentiles": dict(zip(percentiles, np.percentile(damage_samples, percentiles).tolist())),
+        "dps_percentiles": dict(zip(percentiles, np.percentile(dps_samples, percentiles).tolist())),
+        "kill_probability": len(killed) / len(damage_samples),
+        # TTK percentiles are over the samples that killed; NaN when none did
+        "ttk_percentiles": dict(zip(percentiles, np.percentile(killed, percentiles).tolist() if len(killed) else [math.nan] * len(percentiles))),
+        "histogram": histogram.copy() if histogram is not None else None,
+        "histogram_edges": np.asarray(histogram_edges) if histogram_edges is not None else None,
+    }
+
+def run_monte_carlo(*args, **kwargs):
+    summary = None
+    for summary in iter_monte_carlo(*args, **kwargs): pass
+    return summary
+
+# --- 6d. Teamfights ---
+# Crowstorm and the item burns hit everyone in the fight; E, Q, W and the alternator proc hit one selected target
+AREA_EVENTS = frozenset(('R', 'LIANDRYS_BURN', 'FATED_ASHES_BURN'))
+TARGET_POLICIES = ("lowest_hp", "highest_hp")
+
+def select_target(current_enemy_hp, single_target):
+    # single_target is a fixed enemy index or one of TARGET_POLICIES, which pick among enemies still alive.
+    # Once a fixed target is dead, hits fall through to the next living enemy by index (wrapping around).
+    if not isinstance(single_target, str):
+        order = np.roll(np.arange(len(current_enemy_hp)), -single_target)
+        living = order[current_enemy_hp[order] > 0]
+        return int(living[0]) if len(living) else single_target
+    alive_hp = np.where(current_enemy_hp > 0, current_enemy_hp, np.inf if single_target == "lowest_hp" else -np.inf)
+    return int(np.argmin(alive_hp) if single_target == "lowest_hp" else np.argmax(alive_hp))
+
+def simulate_teamfight(combo_type, e_level, w_level, q_level, r_level,
+                       enemy_max_hp, enemy_current_hp, enemy_mr,
+                       total_ap, total_flat_mpen, total_percent_mpen, is_q_feared=False,
+                       has_liandrys_flag=False, has_shadowflame_flag=False,
+                       has_haunting_guise_flag=False, has_alternator_flag=False,
+                       has_fated_ashes_flag=False,
+                       w_ap_ratio_override=None,
+                       total_simulation_duration_for_this_build=0.0,
+                       single_target=0):
+    # One shared timeline against several enemies held as arrays (one entry per enemy). Area events land on every
+    # living enemy in one vector step and single-target events only on the selected one; dead enemies take nothing
+    # more and Shadowflame checks each enemy's own HP. Returns per-enemy (total_damage, final_hp, kill_time) arrays;
+    # one enemy matches simulate_damage_over_time up to its kill, and simulate_time_to_kill after it.
+    timeline = compile_timeline(combo_type, has_liandrys_flag, has_haunting_guise_flag, has_alternator_flag,
+                                has_fated_ashes_flag, total_simulation_duration_for_this_build)
+    enemy_max_hp = np.asarray(enemy_max_hp, dtype=float)
+    prepared = prepare_scenario(e_level, w_level, q_level, r_level, enemy_max_hp,
+                                calculate_damage_multipliers(enemy_mr, total_flat_mpen, total_percent_mpen), total_ap,
+                                is_q_feared, w_ap_ratio_override)
+    current_enemy_hp = np.broadcast_to(np.asarray(enemy_current_hp, dtype=float), enemy_max_hp.shape).copy()
+    enemy_indices = np.arange(len(current_enemy_hp))
+    if not isinstance(single_target, str) and not 0 <= single_target < len(current_enemy_hp):
+        raise IndexError(f"single_target {single_target} is out of range for {len(current_enemy_hp)} enemies")
+    if isinstance(single_target, str) and single_target not in TARGET_POLICIES: raise ValueError(f"Unknown target policy: {single_target!r}")
+    cast_targets = {}
+    def hit_lanes(e_type, is_final, current_enemy_hp):
+        alive = current_enemy_hp > 0
+        if e_type in AREA_EVENTS: return alive
+        # A cast keeps the target picked at its first tick until its last (is_final) tick, or until it dies
+        target = cast_targets.get(e_type)
+        if target is None or not alive[target]: target = select_target(current_enemy_hp, single_target)
+        if is_final or e_type not in ABILITY_KEYS: cast_targets.pop(e_type, None)
+        else: cast_targets[e_type] = target
+        return alive & (enemy_indices == target)
+    return process_lane_events(iter_timeline_events(timeline), prepared, current_enemy_hp, has_shadowflame_flag, hit_lanes,
+                               track_kill_time=True)
+
+def compute_teamfight_results(items, q, w, e, r, max_hp_values, mr_values, combo, feared, w_ratio_override=None,
+                              single_target=0):
+    # Per-enemy and aggregate results for one build against enemies given as parallel max HP / MR sequences
+    item_stats = get_stats_from_items(items)
+    sim_duration = get_simulation_duration(combo, item_stats)
+    per_target_damage, final_hp, kill_time = simulate_teamfight(
+        combo, e, w, q, r, max_hp_values, max_hp_values, mr_values,
+        item_stats["total_ap"], item_stats["total_flat_mpen"], item_stats["total_percent_mpen"],
+        feared, item_stats["has_liandrys"], item_stats["has_shadowflame"],
+        item_stats["has_haunting_guise"], item_stats["has_alternator"],
+        item_stats["has_fated_ashes"], w_ratio_override, sim_duration, single_target
+    )
+    total_damage = float(per_target_damage.sum())
+    return {
+        "total_damage": total_damage, "dps": total_damage / sim_duration if sim_duration > 0 else 0,
+        "per_target_damage": per_target_damage, "final_hp": final_hp, "kill_time": kill_time,
+        "kills": int(np.count_nonzero(~np.isnan(kill_time))), "reported_duration": sim_duration
+    }
+
+# --- 6e. Time to Kill ---
+KILL_SEARCH_LANES = 64  # candidates evaluated per batched refinement round
+
+def simulate_time_to_kill(combo_type, e_level, w_level, q_level, r_level,
+                          enemy_max_hp, enemy_current_hp, enemy_mr,
+                          total_ap, total_flat_mpen, total_percent_mpen, is_q_feared=False,
+                          has_liandrys_flag=False, has_shadowflame_flag=False,
+                          has_haunting_guise_flag=False, has_alternator_flag=False,
+                          has_fated_ashes_flag=False,
+                          w_ap_ratio_override=None,
+                          total_simulation_duration_for_this_build=0.0):
+    timeline = compile_timeline(combo_type, has_liandrys_flag, has_haunting_guise_flag, has_alternator_flag,
+                                has_fated_ashes_flag, total_simulation_duration_for_this_build)
+    damage_multiplier = 1 - calculate_magic_damage_reduction(calculate_effective_mr(enemy_mr, total_flat_mpen, total_percent_mpen))
+    prepared = prepare_scenario(e_level, w_level, q_level, r_level, enemy_max_hp, damage_multiplier, total_ap,
+                                is_q_feared, w_ap_ratio_override)
+    # Stops at the event that takes the enemy to 0 HP; returns (kill_time or None, total, hp)
+    total_damage_dealt, current_enemy_hp, _, kill_time = process_damage_events(timeline, prepared, enemy_current_hp, has_shadowflame_flag, stop_at_kill=True)
+    return kill_time, total_damage_dealt, current_enemy_hp
+
+def compute_time_to_kill(items, q, w, e, r, max_hp, mr, combo, feared, w_ratio_override=None):
+    item_stats = get_stats_from_items(items)
+    kill_time, damage_dealt, final_hp = simulate_time_to_kill(
+        combo, e, w, q, r, max_hp, max_hp, mr,
+        item_stats["total_ap"], item_stats["total_flat_mpen"], item_stats["total_percent_mpen"],
+        feared, item_stats["has_liandrys"], item_stats["has_shadowflame"],
+        item_stats["has_haunting_guise"], item_stats["has_alternator"],
+        item_stats["has_fated_ashes"], w_ratio_override, get_simulation_duration(combo, item_stats)
+    )
+    return {"kills": kill_time is not None, "time_to_kill": kill_time, "damage_dealt": damage_dealt, "final_hp": final_hp}
+
+def split_timeline_at_hp_read(timeline, prepared, has_shadowflame_flag=False):
+    # Events before the first one that reads enemy HP deal the same damage whatever the HP, so a kill search sums them
+    # into amp weights once and steps through only the rest each round. Shadowflame checks HP every tick, so with it
+    # nothing is split off. Returns (prefix amp weights, amp in effect after the prefix, remaining lane events).
+    events, split, amp_weights, global_amp = tuple(iter_timeline_events(timeline)), 0, {}, 1.0
+    if not has_shadowflame_flag:
+        for _, _, e_type, amp_value, is_final, _ in events:
+            if e_type == 'AMP_CHANGE': global_amp = amp_value
+            elif reads_enemy_hp(prepared, e_type, is_final): break
+            else: amp_weights[(e_type, is_final)] = amp_weights.get((e_type, is_final), 0.0) + global_amp
+            split += 1
+    return tuple(amp_weights.items()), global_amp, events[split:]
+
+def simulate_split_kills(split_timeline, prepared, enemy_current_hp, has_shadowflame_flag=False):
+    # Which lanes end at 0 HP, resuming from the prefix of split_timeline_at_hp_read. HP only ever drops, so taking
+    # the prefix's total off at once leaves the same HP as applying it event by event.
+    amp_weights, global_amp, events = split_timeline
+    current_enemy_hp = np.maximum(0, np.asarray(enemy_current_hp, dtype=float) - sum_amp_weighted_damage(amp_weights, prepared))
+    _, final_hp, _ = process_lane_events(events, prepared, current_enemy_hp, has_shadowflame_flag, global_amp=global_amp)
+    return final_hp <= 0
+
+def search_kill_threshold(kills, low, high, tolerance, max_high=None):
+    # Largest value in [low, high] that still kills, assuming kills(values) is True below some threshold.
+    # Each round checks KILL_SEARCH_LANES points in one batched call and keeps the bracket around the last kill;
+    # high doubles (or grows by the bracket width while it is not positive) as long as it still kills, capped at
+    # max_high. Returns None if low already survives, inf if max_high kills.
+    if tolerance <= 0: raise ValueError(f"tolerance must be positive, got {tolerance}")
+    if not low < high: raise ValueError(f"Search bounds must satisfy low < high, got ({low}, {high})")
+    if not kills(np.array([low]))[0]: return None
+    while kills(np.array([high]))[0]:
+        if max_high is not None and high >= max_high: return math.inf
+        high = high + max(high, high - low)
+        if max_high is not None: high = min(high, max_high)
+    while high - low > tolerance:
+        candidates = np.linspace(low, high, KILL_SEARCH_LANES)
+        killed = kills(candidates)
+        last_kill = int(np.flatnonzero(killed)[-1]) if killed.any() else 0
+        low, high = candidates[last_kill], candidates[min(last_kill + 1, KILL_SEARCH_LANES - 1)]
+    return float(low)
+
+def find_max_killable_hp(items, q, w, e, r, mr, combo, feared, w_ratio_override=None, tolerance=1.0, hp_bounds=(1.0, 5000.0)):
+    # Largest full-health enemy max HP the combo kills at this MR (within tolerance), or None if not even hp_bounds[0]
+    item_stats = get_stats_from_items(items)
+    timeline = compile_timeline(combo, item_stats["has_liandrys"], item_stats["has_haunting_guise"], item_stats["has_alternator"],
+                                item_stats["has_fated_ashes"], get_simulation_duration(combo, item_stats))
+    damage_multiplier = 1 - calculate_magic_damage_reduction(calculate_effective_mr(mr, item_stats["total_flat_mpen"], item_stats["total_percent_mpen"]))
+    def prepare(max_hp_values):
+        return prepare_scenario(e, w, q, r, max_hp_values, damage_multiplier, item_stats["total_ap"], feared, w_ratio_override)
+    split_timeline = split_timeline_at_hp_read(timeline, prepare(hp_bounds[0]), item_stats["has_shadowflame"])
+    def kills(max_hp_values):
+        return np.broadcast_to(simulate_split_kills(split_timeline, prepare(max_hp_values), max_hp_values, item_stats["has_shadowflame"]), np.shape(max_hp_values))
+    return search_kill_threshold(kills, hp_bounds[0], hp_bounds[1], tolerance, max_high=1e7)
+
+def find_kill_mr_breakpoint(items, q, w, e, r, max_hp, combo, feared, w_ratio_override=None, tolerance=0.1, mr_bounds=(0.0, 200.0)):
+    # Highest enemy MR at which the combo still kills max_hp (within tolerance); None if it survives at mr_bounds[0]
+    item_stats = get_stats_from_items(items)
+    timeline = compile_timeline(combo, item_stats["has_liandrys"], item_stats["has_haunting_guise"], item_stats["has_alternator"],
+                                item_stats["has_fated_ashes"], get_simulation_duration(combo, item_stats))
+    def prepare(mr_values):
+        return prepare_scenario(e, w, q, r, max_hp, calculate_damage_multipliers(mr_values, item_stats["total_flat_mpen"], item_stats["total_percent_mpen"]),
+                                item_stats["total_ap"], feared, w_ratio_override)
+    split_timeline = split_timeline_at_hp_read(timeline, prepare(mr_bounds[0]), item_stats["has_shadowflame"])
+    def kills(mr_values):
+        return np.broadcast_to(simulate_split_kills(split_timeline, prepare(mr_values), max_hp, item_stats["has_shadowflame"]), np.shape(mr_values))
+    return search_kill_threshold(kills, mr_bounds[0], mr_bounds[1], tolerance, max_high=1e5)
+
+# --- 7. Build Optimizer ---
+ITEM_FLAG_KEYS = {"Liandry's Torment": "has_liandrys", "Shadowflame": "has_shadowflame", "Haunting Guise": "has_haunting_guise",
+                  "Hextech Alternator": "has_alternator", "Fated Ashes": "has_fated_ashes"}
+
+def score_build_stats(item_stats, scenario, metric, sim_duration):
+    combo, q, w, e, r, max_hp, mr, feared, w_ratio_override = scenario
+    total_damage, _, _, _, _ = simulate_damage_over_time(
+        combo, e, w, q, r, max_hp, max_hp, mr,
+        item_stats["total_ap"], item_stats["total_flat_mpen"], item_stats["total_percent_mpen"],
+        feared, item_stats["has_liandrys"], item_stats["has_shadowflame"],
+        item_stats["has_haunting_guise"], item_stats["has_alternator"],
+        item_stats["has_fated_ashes"], w_ratio_override, sim_duration, dense_series=False
+    )
+    if metric == "dps": return total_damage / sim_duration if sim_duration > 0 else 0
+    return total_damage
+
+def get_optimistic_stats(chosen, remaining, free_slots):
+    # Best case for any completion of `chosen`: the free slots take the largest AP, flat pen and % pen of the
+    # remaining items independently and every remaining item flag is owned. Damage never drops with more AP,
+    # penetration or item effects, so scoring these stats bounds every real completion from above.
+    chosen_stats = [ITEM_STATS[name] for name in chosen]
+    remaining_stats = [ITEM_STATS[name] for name in remaining] if free_slots > 0 else []
+    ap = 18 + sum(stats.get("ap", 0) for stats in chosen_stats) + sum(sorted((stats.get("ap", 0) for stats in remaining_stats), reverse=True)[:free_slots])
+    flat_mpen = sum(stats.get("flat_mpen", 0) for stats in chosen_stats) + sum(sorted((stats.get("flat_mpen", 0) for stats in remaining_stats), reverse=True)[:free_slots])
+    mpen_multiplier = 1.0
+    for stats in chosen_stats: mpen_multiplier *= (1 - stats.get("percent_mpen", 0))
+    for value in sorted(1 - stats.get("percent_mpen", 0) for stats in remaining_stats)[:free_slots]: mpen_multiplier *= value
+    owned = set(chosen) | set(remaining if free_slots > 0 else [])
+    if "Rabadon's Deathcap" in owned: ap *= (1 + ITEM_STATS["Rabadon's Deathcap"]["passive_ap_multiplier"])
+    stats = {"total_ap": ap, "total_flat_mpen": flat_mpen, "total_percent_mpen": 1 - mpen_multiplier}
+    stats.update({flag: name in owned for name, flag in ITEM_FLAG_KEYS.items()})
+    return stats
+
+def get_build_score_bound(chosen, remaining, free_slots, scenario, metric):
+    optimistic = get_optimistic_stats(chosen, remaining, free_slots)
+    bound = score_build_stats(optimistic, scenario, metric, get_simulation_duration(scenario[0], optimistic))
+    if metric == "dps":
+        # Burn items lengthen the fight; the shortest duration any completion can have gives the largest DPS
+        owns_burn = any(name in ("Liandry's Torment", "Fated Ashes") for name in chosen)
+        shortest = get_simulation_duration(scenario[0], {"has_liandrys": owns_burn, "has_fated_ashes": False})
+        longest = get_simulation_duration(scenario[0], optimistic)
+        if shortest > 0: bound = bound * longest / shortest
+    return bound
+
+def search_build_subtree(prefix, candidates, scenario, slots, top_n, metric, threshold):
+    # Depth-first over builds extending `prefix` with later candidates, pruning any partial build whose
+    # optimistic bound cannot beat `threshold` (the caller's current N-th best score).
+    found, counters = [], {"evaluated": 0, "pruned": 0}
+    def visit(chosen, start, threshold):
+        free_slots = slots - len(chosen)
+        if free_slots == 0:
+            item_stats = aggregate_item_stats(chosen)
+            score = score_build_stats(item_stats, scenario, metric, get_simulation_duration(scenario[0], item_stats))
+            counters["evaluated"] += 1
+            if len(found) < top_n: heapq.heappush(found, (score, tuple(chosen)))
+            elif score > found[0][0]: heapq.heapreplace(found, (score, tuple(chosen)))
+            return threshold if len(found) < top_n else max(threshold, found[0][0])
+        remaining = candidates[start:]
+        if len(remaining) < free_slots: return threshold
+        if threshold > -math.inf and get_build_score_bound(chosen, remaining, free_slots, scenario, metric) <= threshold:
+            counters["pruned"] += 1
+            return threshold
+        for i in range(start, len(candidates) - free_slots + 1):
+            threshold = visit(chosen + [candidates[i]], i + 1, threshold)
+        return threshold
+    last_index = max((candidates.index(name) for name in prefix), default=-1)
+    visit(list(prefix), last_index + 1, threshold)
+    return found, counters
+
+# Worker processes are started by a fork server (spawn where that is unavailable), never by forking the caller: the
+# app server is multi-threaded, and a fork would copy any lock another thread holds (e.g. ResultCache.lock). One pool is
+# kept for the process and only rebuilt when its size or the data tables change.
+OPTIMIZER_POOL, OPTIMIZER_POOL_KEY = None, None
+OPTIMIZER_POOL_LOCK = threading.Lock()
+
+def init_optimizer_worker(item_stats, ability_data, combo_schedules):
+    # Workers start from a fresh import, so they take over the parent's data tables, edits included
+    for table, values in ((ITEM_STATS, item_stats), (ABILITY_DATA, ability_data), (COMBO_SCHEDULES, combo_schedules)):
+        table.clear(); table.update(values)
+    mark_data_changed()
+
+def get_optimizer_pool(processes):
+    global OPTIMIZER_POOL, OPTIMIZER_POOL_KEY
+    key = (processes, get_data_version())
+    with OPTIMIZER_POOL_LOCK:
+        if OPTIMIZER_POOL_KEY != key:
+            if OPTIMIZER_POOL is not None: OPTIMIZER_POOL.shutdown(wait=False, cancel_futures=True)
+            if "forkserver" in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context("forkserver")
+                context.set_forkserver_preload([__name__])  # workers fork with the engine (and numpy) already imported
+            else:
+                context = multiprocessing.get_context("spawn")
+            OPTIMIZER_POOL = ProcessPoolExecutor(max_workers=processes, mp_context=context,
+                                                 initializer=init_optimizer_worker, initargs=(ITEM_STATS, ABILITY_DATA, COMBO_SCHEDULES))
+            OPTIMIZER_POOL_KEY = key
+        return OPTIMIZER_POOL
+
+def iter_top_builds(combo, q, w, e, r, max_hp, mr, feared, slots=6, top_n=10, metric="total_damage",
+                    w_ratio_override=None, candidates=None, processes=None):
+    # Streams the ranked top-N builds (list of dicts, best first) every time a finished subtree improves them.
+    if metric not in ("total_damage", "dps"): raise ValueError(f"Unknown metric: {metric}")
+    candidates = sorted(candidates if candidates is not None else ITEM_STATS.keys(), key=lambda name: (-ITEM_STATS[name].get("ap", 0), name))
+    slots = min(slots, len(candidates))
+    scenario = (combo, q, w, e, r, max_hp, mr, feared, w_ratio_override)
+    # One task per leading item pair keeps tasks small enough to share improved thresholds between workers
+    tasks = deque(itertools.combinations(candidates, min(2, slots)))
+    processes = processes or os.cpu_count() or 1
+    best = []
+    def threshold(): return best[0][0] if len(best) >= top_n else -math.inf
+    def merge(found):
+        changed = False
+        for entry in found:
+            if len(best) < top_n: heapq.heappush(best, entry); changed = True
+            elif entry[0] > best[0][0]: heapq.heapreplace(best, entry); changed = True
+        return changed
+    def ranked(): return [{"items": sorted(items), "score": score, "metric": metric} for score, items in sorted(best, reverse=True)]
+
+    if processes == 1:
+        while tasks:
+            found, _ = search_build_subtree(tasks.popleft(), candidates, scenario, slots, top_n, metric, threshold())
+            if merge(found): yield ranked()
+        return
+    pool, pending = get_optimizer_pool(processes), set()
+    try:
+        while tasks or pending:
+            while tasks and len(pending) < processes * 2:
+                pending.add(pool.submit(search_build_subtree, tasks.popleft(), candidates, scenario, slots, top_n, metric, threshold()))
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            changed = False
+            for future in done: changed = merge(future.result()[0]) or changed
+            if changed: yield ranked()
+    finally:
+        # The pool outlives this search, so work queued for an abandoned one (e.g. a Streamlit rerun) is dropped
+        for future in pending: future.cancel()
+
+def find_top_builds(*args, **kwargs):
+    ranked = []
+    for ranked in iter_top_builds(*args, **kwargs): pass
+    return ranked
+
+# --- 8. Result Caches ---
+def estimate_size(value):
+    if isinstance(value, dict): return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)): return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    if isinstance(value, np.ndarray): return sys.getsizeof(value) + (0 if value.base is None else value.nbytes)
+    return sys.getsizeof(value)
+
+DATA_EDITS = 0  # bumped by mark_data_changed; the fingerprint below is only recomputed when it moves
+
+@lru_cache(maxsize=1)
+def fingerprint_data_tables(data_edits):
+    return hashlib.sha1(repr((ITEM_STATS, ABILITY_DATA, COMBO_SCHEDULES)).encode()).hexdigest()
+
+def get_data_version():
+    # Content fingerprint of the data tables, used to version the persistent result store
+    return fingerprint_data_tables(DATA_EDITS)
+
+def mark_data_changed():
+    # Flushes every cache derived from the data tables (results, item totals, compiled timelines)
+    global DATA_EDITS
+    DATA_EDITS += 1
+    clear_result_caches()
+
+def update_item_stats(item_name, **fields):
+    ITEM_STATS[item_name].update(fields)
+    mark_data_changed()
+
+def update_ability_data(ability_key, **fields):
+    ABILITY_DATA[ability_key].update(fields)
+    mark_data_changed()
+
+class ResultCache:
+    # Thread-safe LRU keyed on canonical scenario tuples, bounded by entry count and estimated bytes
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024):
+        self.max_entries, self.max_bytes = max_entries, max_bytes
+        self.entries, self.current_bytes = OrderedDict(), 0
+        self.hits = self.misses = self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        size = estimate_size(value)
+        if size > self.max_bytes: return
+        with self.lock:
+            if key in self.entries: self.current_bytes -= self.entries.pop(key)[1]
+            self.entries[key] = (value, size)
+            self.current_bytes += size
+            while len(self.entries) > self.max_entries or self.current_bytes > self.max_bytes:
+                self.current_bytes -= self.entries.popitem(last=False)[1][1]
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self.entries), "bytes": self.current_bytes, "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions, "hit_rate": self.hits / lookups if lookups else 0.0}
+
+# Module-level, so they live as long as the process: Streamlit reruns re-execute app.py but not this import
+RESULT_CACHE = ResultCache(max_entries=512, max_bytes=64 * 1024 * 1024)
+ITEM_STATS_CACHE = ResultCache(max_entries=4096, max_bytes=4 * 1024 * 1024)
+
+def clear_result_caches():
+    RESULT_CACHE.clear(); ITEM_STATS_CACHE.clear(); clear_compiled_timelines()
+
+# --- 8b. Persistent Result Store ---
+# Precomputed run_and_get_results entries in SQLite (filled offline by precompute.py). Rows carry the data version
+# they were computed under, so edits to ITEM_STATS/ABILITY_DATA make old rows invisible instead of wrong.
+RESULT_STORE_ENV = "FIDDLESTICKS_RESULT_STORE"
+RESULT_SCALAR_FIELDS = ("total_damage", "final_hp", "dps", "reported_duration")
+RESULT_ARRAY_FIELDS = ("time_points", "damage_log", "hp_log", "mr_values", "damage_vs_mr")
+RESULT_STORE_COLUMNS = ("key", "data_version", "series", "typecode") + RESULT_SCALAR_FIELDS + RESULT_ARRAY_FIELDS
+
+def canonical_scenario_key(key):
+    # JSON text of a result_cache_key; numbers become floats so 3000 and 3000.0 share a row like they share a cache entry
+    def normalize(value):
+        if isinstance(value, tuple): return [normalize(v) for v in value]
+        if isinstance(value, (int, float)) and not isinstance(value, bool): return float(value)
+        return value
+    return json.dumps(normalize(key), separators=(",", ":"))
+
+class ResultStore:
+    def __init__(self, path, create=False):
+        # Without create the store is opened read-only, which is what app servers should use
+        self.connection = sqlite3.connect(path if create else f"file:{path}?mode=ro", uri=not create, check_same_thread=False)
+        self.lock = threading.Lock()
+        if create:
+            with self.connection:
+                self.connection.execute(
+                    "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, data_version TEXT NOT NULL, series TEXT, "
+                    "typecode TEXT NOT NULL, " + ", ".join(f"{f} REAL" for f in RESULT_SCALAR_FIELDS) + ", " +
+                    ", ".join(f"{f} BLOB" for f in RESULT_ARRAY_FIELDS) + ")")
+        # An empty file, another database or an older layout fails here instead of on every lookup
+        try:
+            columns = tuple(row[1] for row in self.connection.execute("PRAGMA table_info(results)"))
+        except sqlite3.Error:
+            self.connection.close()
+            raise
+        if columns != RESULT_STORE_COLUMNS:
+            self.connection.close()
+            raise ValueError(f"no results table in the current layout (found columns: {', '.join(columns) or 'none'})")
+
+    def get(self, key, data_version):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT series, typecode, " + ", ".join(RESULT_SCALAR_FIELDS + RESULT_ARRAY_FIELDS) +
+                " FROM results WHERE key = ? AND data_version = ?", (canonical_scenario_key(key), data_version)).fetchone()
+        if row is None: return None
+        series, typecode, *values = row
+        results = dict(zip(RESULT_SCALAR_FIELDS, values), series=series)
+        # Arrays are read-only numpy views straight onto the fetched BLOBs; the MR sweep is always stored as doubles
+        for field, blob in zip(RESULT_ARRAY_FIELDS, values[len(RESULT_SCALAR_FIELDS):]):
+            results[field] = np.frombuffer(blob, dtype="d" if field in ("mr_values", "damage_vs_mr") else typecode)
+        return results
+
+    def put_many(self, entries, data_version):
+        # entries are (result_cache_key, compute_results output) pairs, written in one transaction
+        rows = [(canonical_scenario_key(key), data_version, results["series"], results["time_points"].dtype.char,
+                 *(results[f] for f in RESULT_SCALAR_FIELDS), *(bytes(results[f]) for f in RESULT_ARRAY_FIELDS))
+                for key, results in entries]
+        with self.lock, self.connection:
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO results VALUES ({', '.join('?' * (4 + len(RESULT_SCALAR_FIELDS) + len(RESULT_ARRAY_FIELDS)))})", rows)
+
+    def prune(self, data_version):
+        # Drops rows computed under any other data version; returns how many went
+        with self.lock, self.connection:
+            return self.connection.execute("DELETE FROM results WHERE data_version != ?", (data_version,)).rowcount
+
+    def count(self, data_version=None):
+        with self.lock:
+            if data_version is None: return self.connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            return self.connection.execute("SELECT COUNT(*) FROM results WHERE data_version = ?", (data_version,)).fetchone()[0]
+
+    def close(self):
+        with self.lock: self.connection.close()
+
+RESULT_STORE = None
+RESULT_STORE_OPENED = False
+
+def open_result_store(path, create=False):
+    # Points run_and_get_results at a store (None disables it)
+    global RESULT_STORE, RESULT_STORE_OPENED
+    RESULT_STORE, RESULT_STORE_OPENED = (ResultStore(path, create) if path else None), True
+    return RESULT_STORE
+
+def get_result_store():
+    # Lazily opens the store named by $FIDDLESTICKS_RESULT_STORE, if it exists. A store that cannot be read is
+    # reported once and left disabled, so lookups fall back to simulating.
+    if not RESULT_STORE_OPENED:
+        path = os.environ.get(RESULT_STORE_ENV)
+        try:
+            open_result_store(path if path and os.path.exists(path) else None)
+        except (sqlite3.Error, ValueError) as exc:
+            warnings.warn(f"Result store {path} disabled: {exc}")
+            open_result_store(None)
+    return RESULT_STORE
+
+# --- 9. Instrumentation ---
+# Profiling is opt-in per thread: the hot paths only check get_active_profile() once per call and skip all of this
+# when it is None. Streamlit runs each session in its own thread, so sessions never see each other's events.
+PROFILE_STATE = threading.local()
+
+class SimulationProfile:
+    # Event counts, damage attribution by event type, the share added by the Liandry/Haunting amp and Shadowflame,
+    # and wall time per section. Hooks are called as hook(event_time, e_type, final_damage, current_hp).
+    def __init__(self, hooks=()):
+        self.event_counts, self.damage_by_type = {}, {}
+        self.amp_damage = {"liandrys_amp": 0.0, "shadowflame": 0.0}
+        self.timings, self.timing_calls = {}, {}
+        self.timeline_cache = {"hits": 0, "misses": 0}
+        self.hooks = list(hooks)
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def record_event(self, event_time, e_type, raw_damage, global_amp, shadowflame_amp, current_hp):
+        final_damage = raw_damage * global_amp * shadowflame_amp if raw_damage > 0 else 0.0
+        self.event_counts[e_type] = self.event_counts.get(e_type, 0) + 1
+        if e_type != 'AMP_CHANGE':
+            self.damage_by_type[e_type] = self.damage_by_type.get(e_type, 0.0) + final_damage
+            if final_damage:
+                self.amp_damage["liandrys_amp"] += raw_damage * (global_amp - 1)
+                self.amp_damage["shadowflame"] += raw_damage * global_amp * (shadowflame_amp - 1)
+        for hook in self.hooks: hook(event_time, e_type, final_damage, current_hp)
+
+    def add_time(self, section, started):
+        # Adds the time since started to section and returns now, so consecutive sections can chain
+        now = time.perf_counter()
+        self.timings[section] = self.timings.get(section, 0.0) + now - started
+        self.timing_calls[section] = self.timing_calls.get(section, 0) + 1
+        return now
+
+    def to_dict(self):
+        total_damage = sum(self.damage_by_type.values())
+        return {
+            "event_counts": dict(self.event_counts),
+            "damage_by_type": dict(self.damage_by_type),
+            "damage_share": {k: v / total_damage for k, v in self.damage_by_type.items()} if total_damage else {},
+            "amp_damage": dict(self.amp_damage),
+            "timings_ms": {k: v * 1000 for k, v in self.timings.items()},
+            "timing_calls": dict(self.timing_calls),
+            "timeline_cache": dict(self.timeline_cache),
+        }
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.to_dict(), **kwargs)
+
+def get_active_profile():
+    return getattr(PROFILE_STATE, "profile", None)
+
+class profiling:
+    # with profiling() as profile: ... records every simulation run on this thread into profile
+    def __init__(self, profile=None, hooks=()):
+        self.profile = profile if profile is not None else SimulationProfile(hooks)
+
+    def __enter__(self):
+        self.previous = get_active_profile()
+        PROFILE_STATE.profile = self.profile
+        return self.profile
+
+    def __exit__(self, *exc_info):
+        PROFILE_STATE.profile = self.previous
+        return False
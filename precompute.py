@@ -0,0 +1,69 @@
+# Offline precompute job: fills a result store so run_and_get_results can answer popular scenarios without simulating.
+# Point the app at the store with FIDDLESTICKS_RESULT_STORE=results.sqlite.
+import sys
+import argparse
+from engine import SERIES_MODES, combo_options, compute_results, result_cache_key, get_data_version, ResultStore
+from cli import parse_scenario, iter_records, decode_record
+
+# The app always asks for breakpoint series at both W ratios
+APP_W_RATIOS = (0.10, 0.1125)
+BATCH_SIZE = 256
+
+def parse_w_ratios(text):
+    return tuple(None if value.strip().lower() == "none" else float(value) for value in text.split(","))
+
+def iter_store_entries(records, all_combos=False, w_ratios=APP_W_RATIOS, series="breakpoints", errors=None):
+    # Expands each record over every combo (optional) and W ratio (unless the record pins one)
+    for line_number, record in records:
+        try:
+            scenario = parse_scenario(decode_record(record))
+        except (ValueError, TypeError, KeyError) as exc:
+            if errors is None: raise
+            errors.append({"line": line_number, "error": str(exc)})
+            continue
+        combos = list(combo_options.values()) if all_combos else [scenario["combo"]]
+        ratios = [scenario["w_ratio_override"]] if scenario["w_ratio_override"] is not None else w_ratios
+        for combo in combos:
+            for w_ratio in ratios:
+                args = (scenario["items"], scenario["q"], scenario["w"], scenario["e"], scenario["r"],
+                        scenario["max_hp"], scenario["mr"], combo, scenario["feared"], w_ratio, None, series)
+                yield result_cache_key(*args), compute_results(*args)
+
+def run_precompute(stream, store, input_format="jsonl", all_combos=False, w_ratios=APP_W_RATIOS, series="breakpoints"):
+    data_version, errors, batch, written = get_data_version(), [], [], 0
+    for entry in iter_store_entries(iter_records(stream, input_format), all_combos, w_ratios, series, errors):
+        batch.append(entry)
+        if len(batch) >= BATCH_SIZE:
+            store.put_many(batch, data_version); written += len(batch); batch = []
+    if batch: store.put_many(batch, data_version); written += len(batch)
+    return {"written": written, "pruned": store.prune(data_version), "stored": store.count(data_version),
+            "data_version": data_version, "errors": errors}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute results for JSONL/CSV scenarios into a SQLite result store.")
+    parser.add_argument("input", nargs="?", default="-", help="scenario file in the cli.py format, or - for stdin (default)")
+    parser.add_argument("--store", required=True, help="SQLite file to create or update")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="input format (default: from the file extension, else jsonl)")
+    parser.add_argument("--all-combos", action="store_true", help="store every combo for each scenario, not just its own")
+    parser.add_argument("--w-ratios", type=parse_w_ratios, default=APP_W_RATIOS,
+                        help="comma-separated W AP ratios for records without w_ratio_override (default: the app's 0.10,0.1125)")
+    parser.add_argument("--series", choices=SERIES_MODES, default="breakpoints",
+                        help="time series mode to store (default: breakpoints, as the app requests)")
+    args = parser.parse_args(argv)
+    input_format = args.format or ("csv" if args.input.lower().endswith(".csv") else "jsonl")
+    store = ResultStore(args.store, create=True)
+    try:
+        if args.input == "-":
+            summary = run_precompute(sys.stdin, store, input_format, args.all_combos, args.w_ratios, args.series)
+        else:
+            with open(args.input, newline="" if input_format == "csv" else None) as stream:
+                summary = run_precompute(stream, store, input_format, args.all_combos, args.w_ratios, args.series)
+    finally:
+        store.close()
+    for error in summary["errors"]: print(f"line {error['line']}: {error['error']}", file=sys.stderr)
+    print(f"Stored {summary['written']} results ({summary['stored']} for data version {summary['data_version'][:12]}, "
+          f"pruned {summary['pruned']} stale)", file=sys.stderr)
+    return 1 if summary["errors"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())